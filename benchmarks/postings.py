@@ -0,0 +1,105 @@
+"""size and decoding speed of posting lists, compressed or not.
+
+a synthetic corpus whose tokens follow Zipf's law, as words do, is indexed and
+its postings and frequencies are compared as
+
+- pickle   the index pickled with its posting lists as python lists
+- uint32   postings and frequencies as uint32, as in index files of version 1
+- packed   gaps in bit packed blocks, as in index files now (see `sagasu.codec`)
+
+::
+
+    python benchmarks/postings.py --documents 100000
+"""
+import argparse
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+from array import array
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sagasu.codec import (  # noqa: E402
+    BLOCK_SIZE, decode_frequencies, decode_postings, encode_frequencies, encode_postings
+)
+from sagasu.model import IndexedResource, Resource  # noqa: E402
+from sagasu.storage import MappedIndex, write_index  # noqa: E402
+
+
+def build(documents: int, vocabulary: int, length: int) -> IndexedResource:
+    rng = random.Random(0)
+    cum_weights = list(accumulate(1 / rank for rank in range(1, vocabulary + 1)))
+    indexed_resource = IndexedResource(indexed={})
+    for n in range(documents):
+        tokens = [f"t{token}" for token in rng.choices(range(vocabulary), cum_weights=cum_weights, k=length)]
+        indexed_resource.add_postings(indexed_resource.add(Resource(uri=str(n), sentence=""), len(tokens)), tokens)
+    return indexed_resource
+
+
+def timed(function) -> float:
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--length", type=int, default=20, help="tokens per document")
+    args = parser.parse_args()
+
+    indexed_resource = build(args.documents, args.vocabulary, args.length)
+    lists = [
+        (indexed_resource.indexed[term], indexed_resource.frequencies[term])
+        for term in sorted(indexed_resource.indexed)
+    ]
+    print(f"{args.documents} documents, {len(lists)} terms, {sum(len(doc_ids) for doc_ids, _ in lists)} postings")
+
+    pickled = pickle.dumps({
+        "indexed": {term: doc_ids.tolist() for term, doc_ids in indexed_resource.indexed.items()},
+        "frequencies": {term: tfs.tolist() for term, tfs in indexed_resource.frequencies.items()},
+    })
+    uint32 = [(doc_ids.tobytes(), tfs.tobytes(), len(doc_ids)) for doc_ids, tfs in lists]
+    packed = [(encode_postings(doc_ids), encode_frequencies(tfs), len(doc_ids)) for doc_ids, tfs in lists]
+
+    def decode_packed(encoded):
+        for doc_ids, tfs, count in encoded:
+            decode_postings(doc_ids, count)
+            decode_frequencies(tfs, count)
+
+    def decode_uint32(encoded):
+        for doc_ids, tfs, _ in encoded:
+            array("I", doc_ids), array("I", tfs)
+
+    def report(name, encoded, size, decode):
+        count = sum(count for _, _, count in encoded)
+        elapsed = min(timed(decode) for _ in range(3))
+        print(f"{name:14} {size:>12} {size / count:>14.2f} {elapsed * 1000:>8.0f}ms {count / elapsed:>12.3g}")
+
+    print(f"{'':14} {'bytes':>12} {'bytes/posting':>14} {'decode':>10} {'postings/s':>12}")
+    report("pickle", uint32, len(pickled), lambda: pickle.loads(pickled))
+    # queries decode the lists of their terms, the long lists of common terms are the costly ones
+    subsets = [("", lambda encoded: encoded), (" (long)", lambda encoded: [e for e in encoded if e[2] >= BLOCK_SIZE])]
+    for suffix, subset in subsets:
+        for name, encoded, decode in [
+            ("uint32", subset(uint32), decode_uint32), ("packed", subset(packed), decode_packed)
+        ]:
+            size = sum(len(doc_ids) + len(tfs) for doc_ids, tfs, _ in encoded)
+            report(name + suffix, encoded, size, lambda: decode(encoded))
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_index(indexed_resource, path := f"{directory}/benchmark.idx")
+        index = MappedIndex(path)
+        common = max(indexed_resource.indexed, key=lambda term: len(indexed_resource.indexed[term]))
+        elapsed = min(timed(lambda: index._decode_postings(index._find(common))) for _ in range(5))
+        print(f"index file: {os.path.getsize(path)} bytes, "
+              f"the most common term ({len(index.postings(common))} postings) decoded in {elapsed * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
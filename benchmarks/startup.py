@@ -0,0 +1,78 @@
+"""time from starting `sagasu search` until it prompts for a query.
+
+a throwaway home with a config and a small prebuilt index is used, so the
+number only depends on what the search path imports and opens::
+
+    python benchmarks/startup.py --runs 10 --max-seconds 1.0
+
+exits with status 1 when the median is slower than `--max-seconds`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROMPT = b">>> "
+
+
+def prepare_home(home: str):
+    # imported here, so that the benchmark itself does not import anything in the child
+    os.environ["HOME"] = home
+    from sagasu.model import IndexedResource, Resource
+    from sagasu.segments import Segments
+
+    os.makedirs(f"{home}/.sagasu/config")
+    with open(f"{home}/.sagasu/config/config.yml", "w") as f:
+        f.write("sources:\n    - source_type: dummy\n      target: dummy\n")
+    indexed_resource = IndexedResource(indexed={})
+    for n in range(1000):
+        tokens = f"document {n} about term{n % 100} and term{n % 7}".split()
+        doc_id = indexed_resource.add(Resource(uri=f"dummy{n}", sentence=" ".join(tokens)), len(tokens))
+        indexed_resource.add_postings(doc_id, tokens)
+    Segments(f"{home}/.sagasu/indexed/segments").replace(indexed_resource)
+
+
+def time_to_prompt(home: str) -> float:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "sagasu.app", "search"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        env={**os.environ, "HOME": home, "PYTHONUNBUFFERED": "1"},
+    )
+    output = b""
+    try:
+        while not output.endswith(PROMPT):
+            if not (chunk := process.stdout.read1(4096)):
+                raise RuntimeError(f"sagasu exited before prompting: {output.decode()}")
+            output += chunk
+        return time.perf_counter() - started
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        prepare_home(home)
+        times = [time_to_prompt(home) for _ in range(args.runs)]
+    median = statistics.median(times)
+    print(
+        f"time to first prompt: median {median * 1000:.0f}ms, "
+        f"min {min(times) * 1000:.0f}ms, max {max(times) * 1000:.0f}ms"
+    )
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"slower than {args.max_seconds}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
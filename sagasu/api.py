@@ -0,0 +1,213 @@
+"""HTTP/JSON search service, searching the index loaded once for every request.
+
+    GET  /search?q=<query>&page=1&per_page=10   ranked results of a query
+    GET  /grep?q=<text>&regex=0&page=1          documents containing a text, or matching a regex
+    POST /reload                                switch to the latest index on disk
+    GET  /stats                                 number of requests and latency percentiles
+
+the index is also reloaded when a newer one is found on disk, searches running
+meanwhile go on with the previous index, so a reload never makes the service
+unavailable. every response has its latency in the `X-Response-Time` header.
+"""
+import asyncio
+import json
+import re
+import time
+from collections import deque
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from sagasu.engine import SearchEngine
+
+MAX_PER_PAGE = 100
+
+
+class BadRequest(Exception):
+    pass
+
+
+class SearchServer:
+    def __init__(self, engine: SearchEngine, host: str = "127.0.0.1", port: int = 8080, poll: float = 10.0):
+        """the index directory is checked for a newer index every `poll` seconds, never when 0"""
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.poll = poll
+        self.requests = 0
+        # latencies of the latest requests in seconds
+        self.latencies: deque = deque(maxlen=10000)
+        self.reload_lock = asyncio.Lock()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @staticmethod
+    def _paging(params: Dict[str, str]) -> Tuple[int, int]:
+        try:
+            page = int(params.get("page", 1))
+            per_page = int(params.get("per_page", 10))
+        except ValueError:
+            raise BadRequest("page and per_page must be integers")
+        if page < 1 or not 1 <= per_page <= MAX_PER_PAGE:
+            raise BadRequest(f"page must be positive and per_page between 1 and {MAX_PER_PAGE}")
+        return page, per_page
+
+    def search(self, params: Dict[str, str]) -> dict:
+        query = params.get("q", "").strip()
+        page, per_page = self._paging(params)
+        if not query:
+            raise BadRequest("q is required")
+
+        total, ranked = self.engine.query_page(query, (page - 1) * per_page, per_page)
+        return {
+            "query": query,
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "results": [
+                {"uri": resource.uri, "score": score, "sentence": resource.sentence} for resource, score in ranked
+            ],
+        }
+
+    def grep(self, params: Dict[str, str]) -> dict:
+        # spaces may be a part of the text, it is not stripped
+        pattern = params.get("q", "")
+        regex = params.get("regex", "0") not in ("", "0", "false")
+        page, per_page = self._paging(params)
+        if not pattern:
+            raise BadRequest("q is required")
+        try:
+            total, resources = self.engine.grep(pattern, regex, (page - 1) * per_page, per_page)
+        except re.error as e:
+            raise BadRequest(f"invalid pattern: {e}")
+        return {
+            "query": pattern,
+            "regex": regex,
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "results": [{"uri": resource.uri, "sentence": resource.sentence} for resource in resources],
+        }
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+        return {
+            "requests": self.requests,
+            "documents": len(self.engine.indexed_resource),
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
+
+    async def reload(self) -> bool:
+        """load the latest index in a thread, then swap it in"""
+        async with self.reload_lock:
+            reloaded = await asyncio.get_event_loop().run_in_executor(None, self.engine.reload)
+        if reloaded:
+            # the version is None once the index is removed
+            version = self.engine.index_version
+            print(f"reloaded {version[0] if version else 'an empty index'} ({len(self.engine.indexed_resource)} docs)")
+        return reloaded
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll)
+            try:
+                await self.reload()
+            except Exception as e:
+                # keep serving the current index, a broken index may be fixed by the next build
+                print(f"failed to reload index: {e}")
+
+    async def _route(self, method: str, target: str) -> Tuple[HTTPStatus, dict]:
+        url = urlparse(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/search" and method == "GET":
+            # a query holds the GIL anyway, a thread keeps accepting connections meanwhile
+            return HTTPStatus.OK, await asyncio.get_event_loop().run_in_executor(None, self.search, params)
+        if url.path == "/grep" and method == "GET":
+            return HTTPStatus.OK, await asyncio.get_event_loop().run_in_executor(None, self.grep, params)
+        if url.path == "/reload" and method == "POST":
+            return HTTPStatus.OK, {"reloaded": await self.reload()}
+        if url.path == "/stats" and method == "GET":
+            return HTTPStatus.OK, self.stats()
+        return HTTPStatus.NOT_FOUND, {"error": f"no route for {method} {url.path}"}
+
+    @staticmethod
+    def _content_length(headers: Dict[str, str]) -> int:
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise BadRequest("content-length must be an integer")
+        if length < 0:
+            raise BadRequest("content-length must not be negative")
+        return length
+
+    async def _respond(self, request_line: bytes, headers: Dict[str, str]) -> Tuple[HTTPStatus, dict]:
+        try:
+            if len(parts := request_line.decode("latin-1").split(" ", 2)) != 3:
+                raise BadRequest("malformed request")
+            method, target, _ = parts
+            return await self._route(method, target)
+        except BadRequest as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except Exception as e:
+            print(f"failed to handle {request_line!r}: {e}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """answer requests of a connection, kept alive as long as the client wants"""
+        try:
+            while request_line := (await reader.readline()).rstrip(b"\r\n"):
+                started = time.perf_counter()
+                headers = {}
+                while line := (await reader.readline()).rstrip(b"\r\n"):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and request_line.endswith(b"HTTP/1.1")
+                try:
+                    if length := self._content_length(headers):
+                        # requests have no body to read, but it must not be taken for the next request
+                        await reader.readexactly(length)
+                    status, body = await self._respond(request_line, headers)
+                except BadRequest as e:
+                    # where the body ends is unknown, the connection cannot be used for another request
+                    status, body = HTTPStatus.BAD_REQUEST, {"error": str(e)}
+                    keep_alive = False
+                content = json.dumps(body, ensure_ascii=False).encode()
+                elapsed = time.perf_counter() - started
+                self.requests += 1
+                self.latencies.append(elapsed)
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"X-Response-Time: {elapsed * 1000:.3f}ms\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + content
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> asyncio.AbstractServer:
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        if self.poll:
+            asyncio.get_event_loop().create_task(self._watch())
+        return self.server
+
+    async def serve_forever(self):
+        server = await self.start()
+        print(f"serving on http://{self.host}:{server.sockets[0].getsockname()[1]}")
+        async with server:
+            await server.serve_forever()
+
+
+def serve(engine: SearchEngine, host: str = "127.0.0.1", port: int = 8080, poll: float = 10.0):
+    try:
+        asyncio.get_event_loop().run_until_complete(SearchServer(engine, host, port, poll).serve_forever())
+    except KeyboardInterrupt:
+        pass
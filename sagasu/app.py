@@ -1,45 +1,60 @@
 import click
 
 from sagasu import util as u
-from sagasu.config import ConfigUtil
+from sagasu.config import ConfigError, ConfigUtil
 from sagasu.engine import SearchEngine
+from sagasu.indexer import preload
+from sagasu.repl import print_ranked, print_suggestions, repl
 
 
 @click.command()
 @click.argument("mode")
-def app(mode):
-    if mode not in ["search", "indexing", "async"]:
-        print("choice in [search, crawl, indexing]")
+@click.option("--top", default=10, help="number of results to show in search and repl mode")
+@click.option("--full", is_flag=True, help="rebuild the whole index in indexing mode")
+@click.option("--host", default="127.0.0.1", help="address to listen on in serve mode")
+@click.option("--port", default=8080, help="port to listen on in serve mode")
+def app(mode, top, full, host, port):
+    if mode not in ["search", "repl", "indexing", "serve", "async"]:
+        print("choice in [search, repl, indexing, serve]")
         return
 
     if not u.is_exist("/config/config.yml"):
         print("please set ~/.sagasu/config/config.yml")
         return
 
-    config = ConfigUtil().load()
+    try:
+        config = ConfigUtil().load()
+    except ConfigError as e:
+        print(e)
+        return
     print("start setup Search Engine")
     search_engine = SearchEngine(config)
     print("done setup Search Engine")
 
+    if mode != "indexing" and (outdated := search_engine.segments.outdated()) is not None:
+        print(f"{outdated} was written by an older version of sagasu, run `sagasu indexing` to build the index again")
+        return
+
     if mode == "indexing":
         # crawler_engine = CrawlerEngine(config.sources)
         # crawler_engine.crawl_all()
-        search_engine.reduce_indexing_stream()
+        search_engine.reduce_indexing_stream(incremental=not full)
+        # segments are merged in the background, let the merge finish before exiting
+        search_engine.segments.wait()
         # search_engine.indexed_resource.dump()
+    elif mode == "serve":
+        from sagasu.api import serve
+        serve(search_engine, host, port)
     elif mode == "search":
-        word = input("let's type search word >>> ")
-        resources = search_engine.word_search(word)
-        if not resources:
+        preload()
+        word = input("let's type search words (AND by spaces, OR, \"phrase\") >>> ")
+        ranked = search_engine.query_search(word, top)
+        if not ranked:
             print(f"unknown word")
-            print(f"{search_engine.indexed_resource.indexed.keys()}")
-        resources = set(resources)
-        for resource in resources:
-            print(f"""
-[URI]
-  {resource.uri}
-[Sentence]
-  {resource.sentence[:30]}...
-""")
+            print_suggestions(search_engine.suggest(word))
+        print_ranked(ranked)
+    elif mode == "repl":
+        repl(search_engine, top)
 
 
 if __name__ == "__main__":
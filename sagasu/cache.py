@@ -0,0 +1,77 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from sagasu import util
+
+CACHE_WORK_DIR = util.SAGASU_WORKDIR + "/cache"
+
+
+def digest(key) -> str:
+    return hashlib.sha256(key.encode() if isinstance(key, str) else key).hexdigest()
+
+
+class DiskCache:
+    """bytes stored on disk under the sha256 of their key, bounded to `max_bytes`.
+
+    reading an entry touches its file, so when the cache grows over the bound
+    the least recently used entries are evicted first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.size = sum(p.stat().st_size for p in self._entries())
+
+    def _entries(self):
+        return (p for p in self.directory.glob("*/*") if not p.name.endswith(".tmp"))
+
+    def _path(self, key) -> Path:
+        name = digest(key)
+        return self.directory / name[:2] / name
+
+    def get(self, key) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            content = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return content
+
+    def put(self, key, content: bytes):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # written aside and renamed, a concurrent reader never sees a partial entry
+        tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(content)
+        with self.lock:
+            previous = path.stat().st_size if path.exists() else 0
+            os.replace(tmp, path)
+            self.size += len(content) - previous
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            ((p.stat().st_mtime, p.stat().st_size, p) for p in self._entries()), key=lambda e: e[0]
+        )
+        # evict down to 90% of the bound, so that eviction does not run on every put
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            path.unlink(missing_ok=True)
+            self.size -= size
+
+
+class ImageCache:
+    """downloaded images by url, and their features and captions by content hash"""
+
+    def __init__(self, directory: str = CACHE_WORK_DIR):
+        self.images = DiskCache(f"{directory}/images", max_bytes=512 * 2 ** 20)
+        self.features = DiskCache(f"{directory}/features", max_bytes=256 * 2 ** 20)
+        self.captions = DiskCache(f"{directory}/captions", max_bytes=16 * 2 ** 20)
@@ -0,0 +1,123 @@
+import queue
+import threading
+from collections import deque
+from typing import Callable, Deque, Iterator, List, Optional, Tuple
+
+from sagasu import model as m
+
+_DONE = object()
+
+
+class _Job:
+    """a submitted resource, and the number of its images not captioned yet"""
+
+    def __init__(self, resource: m.Resource):
+        self.resource = resource
+        self.remaining = len(resource.image_urls)
+
+
+class CaptionPipeline:
+    """caption images of resources while they are being crawled.
+
+    image urls of a submitted resource are queued to downloader threads, which
+    fetch and preprocess the images. a single inference thread captions them
+    in batches of the captioner, so downloading and inference overlap. both
+    queues are bounded, submitting blocks when the pipeline falls behind.
+
+    captions are written into `image_captions` of the resources. `ready` yields
+    the resources whose captions are all attached, in the order they were
+    submitted, and every one of them is attached when `close` returns.
+    """
+
+    def __init__(
+        self,
+        captioner,
+        image_source: Callable[[str], str] = lambda url: url,
+        downloaders: int = 4,
+        queue_size: int = 64,
+        linger: float = 0.5,
+    ):
+        """`captioner` prepares images with `prepare` and captions them with `caption_prepared`,
+        as ImageCaptioner does. a partial batch is captioned after `linger` seconds without images
+        """
+        self.captioner = captioner
+        self.image_source = image_source
+        self.linger = linger
+        self.urls: queue.Queue = queue.Queue(queue_size)
+        self.prepared: queue.Queue = queue.Queue(queue_size)
+        self.jobs: Deque[_Job] = deque()
+        self.lock = threading.Lock()
+        self.downloaders = [threading.Thread(target=self._download, daemon=True) for _ in range(downloaders)]
+        self.inference = threading.Thread(target=self._infer, daemon=True)
+        for thread in self.downloaders + [self.inference]:
+            thread.start()
+
+    def submit(self, resource: m.Resource):
+        resource.image_captions = ["empty" for _ in resource.image_urls]
+        self.jobs.append(job := _Job(resource))
+        for idx, url in enumerate(resource.image_urls):
+            self.urls.put((job, idx, url))
+
+    def ready(self) -> Iterator[m.Resource]:
+        """pop the resources submitted first whose images are all captioned"""
+        while self.jobs and self.jobs[0].remaining == 0:
+            yield self.jobs.popleft().resource
+
+    def _attach(self, job: _Job, idx: int, caption: Optional[str]):
+        """attach a caption, or none when the image could not be captioned"""
+        with self.lock:
+            if caption is not None:
+                job.resource.image_captions[idx] = caption
+            job.remaining -= 1
+
+    def _download(self):
+        while (item := self.urls.get()) is not _DONE:
+            job, idx, url = item
+            try:
+                prepared = self.captioner.prepare(self.image_source(url))
+            except Exception as e:
+                # the image keeps an empty caption, rather than failing the whole crawl
+                print(f"failed to download {url}: {e}")
+                self._attach(job, idx, None)
+                continue
+            if prepared.caption is not None:
+                self._attach(job, idx, prepared.caption)
+            else:
+                self.prepared.put((job, idx, prepared))
+
+    def _batches(self) -> Iterator[List[Tuple[_Job, int, object]]]:
+        batch = []
+        while True:
+            try:
+                item = self.prepared.get(timeout=self.linger if batch else None)
+            except queue.Empty:
+                yield batch
+                batch = []
+                continue
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) == self.captioner.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _infer(self):
+        for batch in self._batches():
+            try:
+                captions = self.captioner.caption_prepared([prepared for _, _, prepared in batch])
+            except Exception as e:
+                print(f"failed to caption {len(batch)} images: {e}")
+                captions = [None] * len(batch)
+            for (job, idx, _), caption in zip(batch, captions):
+                self._attach(job, idx, caption)
+
+    def close(self):
+        """wait until every submitted image is captioned"""
+        for _ in self.downloaders:
+            self.urls.put(_DONE)
+        for thread in self.downloaders:
+            thread.join()
+        self.prepared.put(_DONE)
+        self.inference.join()
@@ -0,0 +1,126 @@
+"""bit packed blocks of integers, for posting lists and term frequencies.
+
+a list is cut into blocks of `BLOCK_SIZE` values, each block is stored as::
+
+    width(B) values packed in `width` bits each, least significant bit first
+
+document ids are stored as gaps from the previous one and frequencies minus one,
+so the long posting lists of common terms, whose gaps are small, take a few bits
+per document instead of four bytes. numpy unpacks the blocks of a long list at
+once, it is imported on first use since searching starts without it.
+"""
+from array import array
+from collections import defaultdict
+from itertools import accumulate
+from typing import List, Sequence
+
+BLOCK_SIZE = 128
+# lists of a single block, those of most of the terms, are packed and unpacked faster without numpy
+_SMALL = BLOCK_SIZE
+
+
+def _pack(values: Sequence[int]) -> bytes:
+    """a list of a single block"""
+    if not len(values):
+        return b""
+    width = max(values).bit_length()
+    packed = 0
+    for i, value in enumerate(values):
+        packed |= value << (i * width)
+    return bytes([width]) + packed.to_bytes((len(values) * width + 7) // 8, "little")
+
+
+def encode(values: Sequence[int]) -> bytes:
+    if len(values) <= _SMALL:
+        return _pack(values)
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.uint32)
+    encoded = bytearray()
+    for start in range(0, len(values), BLOCK_SIZE):
+        block = values[start: start + BLOCK_SIZE]
+        width = int(block.max()).bit_length()
+        encoded.append(width)
+        if width:
+            bits = (block[:, None] >> np.arange(width, dtype=np.uint32)) & 1
+            encoded += np.packbits(bits.astype(np.uint8).ravel(), bitorder="little").tobytes()
+    return bytes(encoded)
+
+
+def _decode(data, count: int):
+    import numpy as np
+
+    values = np.zeros(count, dtype=np.uint32)
+    if not count:
+        return values
+    # full blocks of the same width are unpacked together, only the headers are read one by one
+    blocks = defaultdict(list)
+    position = 0
+    for start in range(0, count, BLOCK_SIZE):
+        n = min(BLOCK_SIZE, count - start)
+        width = data[position]
+        blocks[width, n].append((start, position + 1))
+        position += 1 + (n * width + 7) // 8
+
+    buffer = np.frombuffer(data, np.uint8, position)
+    for (width, n), starts in blocks.items():
+        if not width:
+            continue
+        size = (n * width + 7) // 8
+        starts = np.array(starts)
+        packed = buffer[starts[:, 1, None] + np.arange(size)]
+        bits = np.unpackbits(packed, axis=1, bitorder="little")[:, : n * width]
+        unpacked = bits.reshape(len(starts), n, width).astype(np.uint32) @ (
+            np.uint32(1) << np.arange(width, dtype=np.uint32)
+        )
+        values[(starts[:, 0, None] + np.arange(n)).ravel()] = unpacked.ravel()
+    return values
+
+
+def _unpack(data, count: int) -> List[int]:
+    """values of a list of a single block"""
+    if not count:
+        return []
+    width = data[0]
+    packed = int.from_bytes(data[1: 1 + (count * width + 7) // 8], "little")
+    mask = (1 << width) - 1
+    return [packed >> (i * width) & mask for i in range(count)]
+
+
+def decode(data, count: int) -> array:
+    """the `count` values encoded at the start of data"""
+    if count <= _SMALL:
+        return array("I", _unpack(data, count))
+    return array("I", _decode(data, count).tobytes())
+
+
+def encode_postings(doc_ids: Sequence[int]) -> bytes:
+    if len(doc_ids) <= _SMALL:
+        return _pack([doc_id - previous for previous, doc_id in zip([0, *doc_ids], doc_ids)])
+    import numpy as np
+
+    return encode(np.diff(np.asarray(doc_ids, dtype=np.uint32), prepend=np.uint32(0)))
+
+
+def decode_postings(data, count: int) -> array:
+    if count <= _SMALL:
+        return array("I", accumulate(_unpack(data, count)))
+    import numpy as np
+
+    return array("I", np.cumsum(_decode(data, count), dtype=np.uint32).tobytes())
+
+
+def encode_frequencies(frequencies: Sequence[int]) -> bytes:
+    if len(frequencies) <= _SMALL:
+        return _pack([frequency - 1 for frequency in frequencies])
+    import numpy as np
+
+    return encode(np.asarray(frequencies, dtype=np.uint32) - np.uint32(1))
+
+
+def decode_frequencies(data, count: int) -> array:
+    if count <= _SMALL:
+        return array("I", (value + 1 for value in _unpack(data, count)))
+    import numpy as np
+
+    return array("I", (_decode(data, count) + np.uint32(1)).tobytes())
@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+import difflib
+import os
+from dataclasses import MISSING, dataclass, fields
 from typing import List
 
 import yaml
@@ -10,11 +12,35 @@ from sagasu import util
 class SourceModel:
     source_type: str
     target: str
+    # number of concurrent requests, and requests per second, while crawling
+    concurrency: int = 4
+    rate: float = 2.0
+    # base url of the Scrapbox API, may point to a local server for benchmarking
+    endpoint: str = "https://scrapbox.io"
+
+
+class ConfigError(Exception):
+    pass
+
+
+def _source(c: dict, n: int) -> SourceModel:
+    """a source of the config file, naming the keys which are unknown or missing"""
+    keys = [f.name for f in fields(SourceModel)]
+    for key in c:
+        if key not in keys:
+            close = difflib.get_close_matches(key, keys, n=1)
+            hint = f", did you mean {close[0]}?" if close else f", expected one of {', '.join(keys)}"
+            raise ConfigError(f"unknown key {key} in source {n} of config.yml{hint}")
+    for f in fields(SourceModel):
+        if f.default is MISSING and f.name not in c:
+            raise ConfigError(f"source {n} of config.yml has no {f.name}")
+    return SourceModel(**c)
 
 
 @dataclass
 class ConfigModel:
     sources: List[SourceModel]
+    workers: int = os.cpu_count() or 1
 
 
 class ConfigUtil:
@@ -26,8 +52,9 @@ class ConfigUtil:
             _config = yaml.safe_load(f)
             config = ConfigModel(
                 sources=[
-                    SourceModel(source_type=c["source_type"], target=c["target"])
-                    for c in _config["sources"]
-                ]
+                    _source(c, n)
+                    for n, c in enumerate(_config["sources"], 1)
+                ],
+                workers=_config.get("workers", os.cpu_count() or 1),
             )
         return config
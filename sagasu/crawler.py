@@ -3,21 +3,19 @@ import json
 import os
 import re
 from functools import reduce
-from time import sleep
-from typing import List
-
-import pandas as pd
-import requests as req
-import tweepy
-from tqdm import tqdm
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Set
 
 from sagasu import model as m
 from sagasu import util
+from sagasu.caption_pipeline import CaptionPipeline
 from sagasu.config import SourceModel
 from sagasu.model import DummyResource
 
+if TYPE_CHECKING:
+    import tweepy
+
 if os.getenv('SAGASU_CAPTION'):
-    from sagasu.image_captioning import image_captioning_from_url
+    from sagasu.image_captioning import get_captioner
 
 CONSUMER_KEY = os.getenv("CONSUMER_KEY")
 CONSUMER_SECRET = os.getenv("CONSUMER_SECRET")
@@ -27,27 +25,82 @@ ACCESS_TOKEN_SECRET = os.getenv("ACCESS_TOKEN_SECRET")
 CRAWLER_WORK_DIR = util.SAGASU_WORKDIR + "/crawler"
 
 JST = datetime.timezone(datetime.timedelta(hours=+9), "JST")
+# crawled resources are dumped to the snapshot in batches of about this many characters of sentences
+DUMP_SIZE = 16 * 2 ** 20
+
+
+def snapshot(path_prefix: str, resource_type):
+    # numpy is imported by the snapshot once resources are stored or loaded, not by searching
+    from sagasu.snapshot import Snapshot
+    return Snapshot(f"{path_prefix}/resources.snapshot", resource_type, path_prefix)
 
 
 class Crawler:
     def __init__(self, source: SourceModel):
         self.path_prefix = CRAWLER_WORK_DIR
-        self.resources: List[m.Resource] = []
+        # uris of the resources of the last crawl, the resources themselves are not kept
+        self.crawled: Set[str] = set()
         self.source = source
+        self.incremental = False
 
-    def _collect(self) -> List[m.Resource]:
+    def _collect(self) -> Iterable[m.Resource]:
         raise NotImplementedError("not implemented")
 
-    def _dump(self):
+    def _dump(self, resources: List[m.Resource]):
         raise NotImplementedError("not implemented")
 
+    def stream(self) -> Iterator[m.Resource]:
+        """crawl, yielding resources while they are collected, and dump them batch by batch"""
+        self.crawled = set()
+        batch, size = [], 0
+        for resource in self._collect():
+            self.crawled.add(resource.uri)
+            yield resource
+            batch.append(resource)
+            if (size := size + len(resource.sentence)) >= DUMP_SIZE:
+                self._dump(batch)
+                batch, size = [], 0
+        if batch:
+            self._dump(batch)
+
     def __call__(self, *args, **kwargs):
-        self.resources = self._collect()
-        self._dump()
+        for _ in self.stream():
+            pass
+
+    def save_state(self):
+        """remember what has been crawled, once the crawled resources are in the index"""
+        pass
+
+    def crawled_uris(self) -> Set[str]:
+        return self.crawled
+
+    def owns(self, uri: str) -> bool:
+        """whether the document belongs to this source, so that it is removed from
+        the index when it is not crawled anymore"""
+        return False
 
     @staticmethod
-    def _image_captioning(media_url: str) -> str:
-        return image_captioning_from_url(media_url)
+    def _image_source(image_url: str) -> str:
+        """url of the image file itself"""
+        return image_url
+
+    def _captioned(self, resources: Iterable[m.Resource]) -> Iterator[m.Resource]:
+        """caption images of the resources in the background while the crawl goes on.
+
+        a resource is yielded once its captions are attached, so that it is hashed and
+        stored with them.
+        """
+        if not os.getenv("SAGASU_CAPTION"):
+            yield from resources
+            return
+        pipeline = CaptionPipeline(get_captioner(), self._image_source)
+        try:
+            for resource in resources:
+                pipeline.submit(resource)
+                yield from pipeline.ready()
+        finally:
+            pipeline.close()
+        yield from pipeline.ready()
 
 
 class DummyCrawler(Crawler):
@@ -56,49 +109,45 @@ class DummyCrawler(Crawler):
             DummyResource(uri="dummy", sentence="ある晴れた日のこと。魔法以上の愉快が限りなく降り注ぐ不可能じゃないわ。")
         ]
 
-    def _dump(self):
+    def _dump(self, resources: List[m.Resource]):
         pass
 
+    def owns(self, uri: str) -> bool:
+        return uri.startswith("dummy")
+
 
 class TwitterFavoriteCrawler(Crawler):
     def __init__(self, source: SourceModel):
         super().__init__(source)
         self.path_prefix += "/twitter"
-        self.resources: List[m.TwitterResource] = []
+        self.snapshot = snapshot(self.path_prefix, m.TwitterResource)
 
-    def _collect(self) -> List[m.Resource]:
-        statuses: List[tweepy.models.Status] = self._load_favorites()
-
-        resources = []
-        for status in statuses:
-            uri = f"https://twitter.com/_/status/{status.id}"
-            sentence = "".join(status.text.split("\n"))
-            media_urls = []
-            media_captions = []
-
-            if "media" in status.entities:
-                for media in status.extended_entities["media"]:
-                    media_url = media["media_url"]
-                    media_caption = (
-                        self._image_captioning(media_url)
-                        if os.getenv("SAGASU_CAPTION")
-                        else "empty"
-                    )
-                    media_urls.append(media_url)
-                    media_captions.append(media_caption)
-
-            resources.append(
-                m.TwitterResource(
-                    uri=uri,
-                    sentence=sentence,
-                    image_urls=media_urls,
-                    image_captions=media_captions,
-                )
-            )
+    def _collect(self) -> Iterator[m.TwitterResource]:
+        statuses: List["tweepy.models.Status"] = self._load_favorites()
+        yield from self._captioned(self._resource(status) for status in statuses)
+
+    @staticmethod
+    def _resource(status: "tweepy.models.Status") -> m.TwitterResource:
+        uri = f"https://twitter.com/_/status/{status.id}"
+        sentence = "".join(status.text.split("\n"))
+        media_urls = []
+
+        if "media" in status.entities:
+            for media in status.extended_entities["media"]:
+                media_urls.append(media["media_url"])
+
+        return m.TwitterResource(
+            uri=uri,
+            sentence=sentence,
+            image_urls=media_urls,
+            image_captions=["empty" for _ in media_urls],
+        )
 
-        return resources
+    def _load_favorites(self) -> List["tweepy.models.Status"]:
+        # tweepy, tqdm and requests are imported by the crawl only, searching does not need them
+        import tweepy
+        from tqdm import tqdm
 
-    def _load_favorites(self) -> List[tweepy.models.Status]:
         auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
         auth.set_access_token(ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
         api = tweepy.API(auth)
@@ -112,135 +161,89 @@ class TwitterFavoriteCrawler(Crawler):
 
         return statuses
 
-    def _dump(self):
-        filename_prefix = datetime.datetime.now(JST).strftime("/%Y-%m-%d-%H")
-        resource_type_prefix = "/uri-sentence"
-
-        filename = self.path_prefix + resource_type_prefix + filename_prefix + ".tsv"
-        util.mkdir_p(filename)
-
-        uri_sentence_pairs = list(
-            map(lambda resource: [resource.uri, resource.sentence], self.resources)
-        )
-        pd.DataFrame(uri_sentence_pairs, columns=["uri", "sentence"]).to_csv(
-            filename, sep="\t"
-        )
-
-        resource_type_prefix = "/uri-media"
-        filename = self.path_prefix + resource_type_prefix + filename_prefix + ".tsv"
-        util.mkdir_p(filename)
-
-        def extract(resource: List[str]):
-            _1, _2, _3, _4 = (resource + ["empty", "empty", "empty", "empty"])[:4]
-            return _1, _2, _3, _4
-
-        uri_media_pairs = list(
-            map(
-                lambda resource: [resource.uri]
-                + list(extract(resource.image_urls))
-                + list(extract(resource.image_captions)),
-                self.resources,
-            )
-        )
-        pd.DataFrame(
-            uri_media_pairs,
-            columns=[
-                "uri",
-                "media_url1",
-                "media_url2",
-                "media_url3",
-                "media_url4",
-                "media_caption1",
-                "media_caption2",
-                "media_caption3",
-                "media_caption4",
-            ],
-        ).to_csv(filename, sep="\t")
-        return
+    def _dump(self, resources: List[m.TwitterResource]):
+        self.snapshot.append(resources)
 
 
 class ScrapboxCrawler(Crawler):
-    def __init__(self, source: SourceModel):
+    def __init__(self, source: SourceModel, incremental: bool = False):
         super().__init__(source=source)
         self.path_prefix += "/scrapbox"
         self.target = self.source.target
+        self.snapshot = snapshot(self.path_prefix, m.ScrapboxResource)
+        # when incremental, only pages updated since the last crawl are fetched
+        self.incremental = incremental
+        self.state_path = f"{self.path_prefix}/state/{self.target}.json"
+        # page id -> updated time, of every page listed by the last crawl
+        self.state: Dict[str, int] = {}
+        self.listed_uris: Set[str] = set()
+
+    def owns(self, uri: str) -> bool:
+        return uri.startswith(f"https://scrapbox.io/{self.target}/")
+
+    @staticmethod
+    def _image_source(image_url: str) -> str:
+        # a gyazo url is a page showing the image, the image itself is under /raw
+        return f"{image_url}/raw"
+
+    def _page_uri(self, title: str) -> str:
+        return f"https://scrapbox.io/{self.target}/{title.replace('/', '%2F')}"
+
+    def crawled_uris(self) -> Set[str]:
+        # unchanged pages are not fetched but are still in the project
+        return self.listed_uris
+
+    def _load_state(self) -> Dict[str, int]:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def save_state(self):
+        # saved only once the index has the pages, a page seen but not indexed would be skipped until edited
+        util.mkdir_p(self.state_path)
+        with open(self.state_path, "w") as f:
+            json.dump(self.state, f)
+
+    def _collect(self) -> Iterator[m.ScrapboxResource]:
+        from tqdm import tqdm
+
+        from sagasu.fetcher import Fetcher
 
-    def _collect(self) -> List[m.ScrapboxResource]:
-        skip = 0
         limit = 100
-        page_url = f"https://scrapbox.io/api/pages/{self.target}"
+        page_url = f"{self.source.endpoint}/api/pages/{self.target}"
+        fetcher = Fetcher(concurrency=self.source.concurrency, rate=self.source.rate)
 
-        responses = [req.get(f"{page_url}?skip={skip}&limit={limit}")]
+        responses = [fetcher.get(f"{page_url}?skip=0&limit={limit}")]
         count = json.loads(responses[0].text)['count']
-        skip += limit
-        while count > skip:
-            responses.append(req.get(f"{page_url}?skip={skip}&limit={limit}"))
-            skip += limit
+        responses += fetcher.map(f"{page_url}?skip={skip}&limit={limit}" for skip in range(limit, count, limit))
 
-        resources = []
         pages = reduce(lambda x, y: x + y, [json.loads(res.text)['pages'] for res in responses])
+        self.listed_uris = {self._page_uri(page["title"]) for page in pages}
+        previous_state = self._load_state() if self.incremental else {}
+        self.state = {page["id"]: page["updated"] for page in pages}
+        pages = [page for page in pages if previous_state.get(page["id"]) != page["updated"]]
+
         progress_bar = tqdm(total=len(pages))
         progress_bar.set_description("collecting scrapbox")
-        for page in pages:
-            title = t if "/" not in (t := page["title"]) else t.replace("/", "%2F")
-            page = json.loads(req.get(f"{page_url}/{title}").text)
-            sentence = " ".join(lines := list(
-                map(lambda p: p.get("text"), page.get("lines") if page.get("lines") is not None else [])))
-            image_uris = [s[1:-1] for s in lines if re.match(r"\[https://gyazo.com", s)]
-            image_captions = ["empty" for _ in image_uris]
-            resources.append(
-                m.ScrapboxResource(
+        titles = [t if "/" not in (t := page["title"]) else t.replace("/", "%2F") for page in pages]
+
+        def fetched() -> Iterator[m.ScrapboxResource]:
+            for title, response in zip(titles, fetcher.map(f"{page_url}/{title}" for title in titles)):
+                page = json.loads(response.text)
+                sentence = " ".join(lines := list(
+                    map(lambda p: p.get("text"), page.get("lines") if page.get("lines") is not None else [])))
+                image_uris = [s[1:-1] for s in lines if re.match(r"\[https://gyazo.com", s)]
+                image_captions = ["empty" for _ in image_uris]
+                yield m.ScrapboxResource(
                     uri=f"https://scrapbox.io/{self.target}/{title}",
                     sentence=sentence,
                     image_urls=image_uris,
                     image_captions=image_captions,
                 )
-            )
-            sleep(0.5)
-            progress_bar.update(1)
-        return resources
+                progress_bar.update(1)
 
-    def _dump(self):
-        filename_prefix = datetime.datetime.now(JST).strftime("/%Y-%m-%d-%H")
-        resource_type_prefix = "/uri-sentence"
+        yield from self._captioned(fetched())
 
-        filename = self.path_prefix + resource_type_prefix + filename_prefix + ".tsv"
-        util.mkdir_p(filename)
-        uri_sentence_pairs = list(
-            map(lambda resource: [resource.uri, resource.sentence], self.resources)
-        )
-        pd.DataFrame(uri_sentence_pairs, columns=["uri", "sentence"]).to_csv(
-            filename, sep="\t"
-        )
-
-        resource_type_prefix = "/uri-media"
-        filename = self.path_prefix + resource_type_prefix + filename_prefix + ".tsv"
-        util.mkdir_p(filename)
-
-        def extract(resource: List[str]):
-            _1, _2, _3, _4 = (resource + ["empty", "empty", "empty", "empty"])[:4]
-            return _1, _2, _3, _4
-
-        uri_media_pairs = list(
-            map(
-                lambda resource: [resource.uri]
-                + list(extract(resource.image_urls))
-                + list(extract(resource.image_captions)),
-                self.resources,
-            )
-        )
-        pd.DataFrame(
-            uri_media_pairs,
-            columns=[
-                "uri",
-                "media_url1",
-                "media_url2",
-                "media_url3",
-                "media_url4",
-                "media_caption1",
-                "media_caption2",
-                "media_caption3",
-                "media_caption4",
-            ],
-        ).to_csv(filename, sep="\t")
-        return
+    def _dump(self, resources: List[m.ScrapboxResource]):
+        self.snapshot.append(resources)
@@ -0,0 +1,173 @@
+"""sorted term dictionary, for prefix and typo tolerant lookup of the terms of an index.
+
+terms are front coded in blocks of `BLOCK_SIZE` terms: the first term of a block
+is stored whole, every other term as the number of characters it shares with
+the previous one, followed by the rest of it in utf-8::
+
+    shared characters(varint) suffix length(varint) suffix
+
+a block is found by binary search over the first terms of the blocks, and then
+read term by term, so the dictionary is a single bytes object and an offset per
+block instead of a string object per term.
+"""
+from array import array
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+BLOCK_SIZE = 16
+
+
+def _varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _shared(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+class TermDictionary:
+    def __init__(self, blocks: bytes, offsets: array, count: int):
+        """`offsets` are the starts of the blocks in `blocks`, followed by its length"""
+        self.blocks = blocks
+        self.offsets = offsets
+        self.count = count
+
+    @classmethod
+    def from_sorted(cls, terms: Iterable[str]) -> "TermDictionary":
+        """build the dictionary of terms given in sorted order, without holding them all"""
+        blocks = bytearray()
+        offsets = array("I")
+        previous = ""
+        count = 0
+        for count, term in enumerate(terms, 1):
+            if (count - 1) % BLOCK_SIZE == 0:
+                offsets.append(len(blocks))
+                shared = 0
+            else:
+                shared = _shared(previous, term)
+            suffix = term[shared:].encode()
+            blocks += _varint(shared) + _varint(len(suffix)) + suffix
+            previous = term
+        offsets.append(len(blocks))
+        return cls(bytes(blocks), offsets, count)
+
+    @classmethod
+    def from_terms(cls, terms: Iterable[str]) -> "TermDictionary":
+        return cls.from_sorted(sorted(set(terms)))
+
+    @classmethod
+    def from_index(cls, index) -> "TermDictionary":
+        # a mapped index keeps its terms sorted already
+        if hasattr(index, "terms"):
+            return cls.from_sorted(index.terms())
+        return cls.from_terms(index.indexed.keys())
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.blocks) + self.offsets.itemsize * len(self.offsets)
+
+    def _entries(self, block: int = 0) -> Iterator[Tuple[int, str]]:
+        """(characters shared with the previous term, term) of every term from the block"""
+        data = self.blocks
+        pos = self.offsets[block]
+        term = ""
+        while pos < len(data):
+            shared, pos = _read_varint(data, pos)
+            length, pos = _read_varint(data, pos)
+            term = term[:shared] + data[pos: pos + length].decode()
+            pos += length
+            yield shared, term
+
+    def _head(self, block: int) -> str:
+        # the first term of a block shares nothing
+        pos = self.offsets[block] + 1
+        length, pos = _read_varint(self.blocks, pos)
+        return self.blocks[pos: pos + length].decode()
+
+    def _block_of(self, term: str) -> int:
+        """the last block starting with a term not greater than `term`"""
+        lo, hi = 0, len(self.offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._head(mid) <= term:
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(lo - 1, 0)
+
+    def __iter__(self) -> Iterator[str]:
+        return (term for _, term in self._entries())
+
+    def __contains__(self, term) -> bool:
+        return any(found == term for found in self.prefix(term, limit=1))
+
+    def prefix(self, prefix: str, limit: Optional[int] = None) -> Iterator[str]:
+        """terms starting with the prefix, in sorted order"""
+        if not self.count:
+            return
+        found = 0
+        for _, term in self._entries(self._block_of(prefix)):
+            if term < prefix:
+                continue
+            if not term.startswith(prefix) or found == limit:
+                return
+            found += 1
+            yield term
+
+    def fuzzy(self, word: str, max_distance: int) -> Iterator[Tuple[str, int]]:
+        """(term, edit distance) of the terms within `max_distance` edits of the word.
+
+        terms are visited in sorted order like the paths of a trie: the distances of a
+        prefix shared with the previous term are reused, and the terms under a prefix
+        already too far from the word are skipped.
+        """
+        # rows[i] are the distances between term[:i] and every prefix of the word
+        rows = [list(range(len(word) + 1))]
+        # length of the prefix of the previous term too far from the word
+        dead = None
+        for shared, term in self._entries():
+            if dead is not None and shared >= dead:
+                continue
+            dead = None
+            del rows[shared + 1:]
+            for i in range(shared, len(term)):
+                above = rows[i]
+                row = [above[0] + 1]
+                for j, char in enumerate(word, 1):
+                    row.append(min(row[j - 1] + 1, above[j] + 1, above[j - 1] + (char != term[i])))
+                rows.append(row)
+                if min(row) > max_distance:
+                    dead = i + 1
+                    break
+            else:
+                if (distance := rows[-1][-1]) <= max_distance:
+                    yield term, distance
+
+    def suggest(self, word: str, limit: int = 5, weight: Optional[Callable[[str], int]] = None) -> List[str]:
+        """terms close to a word which is not a term itself, closest and heaviest first"""
+        # one typo in a short word, two in a longer one
+        max_distance = 1 if len(word) < 6 else 2
+        found = [(distance, -weight(term) if weight else 0, term) for term, distance in self.fuzzy(word, max_distance)]
+        return [term for distance, _, term in sorted(found) if distance][:limit]
@@ -1,19 +1,20 @@
-import asyncio
-import datetime
-import pickle
 from functools import reduce
-from itertools import product
-from pathlib import Path
-from typing import List
-
-from joblib import delayed, Parallel
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 from sagasu.config import ConfigModel, SourceModel
 from sagasu.crawler import Crawler, TwitterFavoriteCrawler, ScrapboxCrawler, DummyCrawler
-from sagasu.indexer import Indexer, WordNgramIndexer
+from sagasu.dictionary import TermDictionary
+from sagasu.executor import IndexingExecutor
+from sagasu.incremental import Changes
+from sagasu.indexer import WordNgramIndexer, tokenize
 from sagasu.model import Resource, IndexedResource
+from sagasu.query import QueryEvaluator, parse
+from sagasu.ranking import BM25
+from sagasu.registry import DocumentRegistry
 from sagasu.repository import Repository, TwitterRepository, ScrapboxRepository, DummyRepository
-from sagasu.util import SAGASU_WORKDIR, mkdir_p, JST
+from sagasu.segments import SegmentedIndex, Segments
+from sagasu.trigram import TrigramSearcher
+from sagasu.util import SAGASU_WORKDIR
 
 
 class SearchEngine:
@@ -23,26 +24,53 @@ class SearchEngine:
             WordNgramIndexer(n=2),
             WordNgramIndexer(n=3),
         ]
-        self.indexed_resource: IndexedResource = (
-            self.load_indexed()
-            if Path(f"{SAGASU_WORKDIR}/indexed").exists()
-            else IndexedResource(indexed={})
-        )
+        self.segments = Segments(f"{SAGASU_WORKDIR}/indexed/segments")
+        self.index_version = self._index_version()
+        self.indexed_resource: Union[IndexedResource, SegmentedIndex] = self.load_indexed()
+        self._trigrams: Optional[TrigramSearcher] = None
+        self._terms: Optional[Tuple[Union[IndexedResource, SegmentedIndex], TermDictionary]] = None
         self.config = config
         self.repositories: List[Repository] = [
             self.load_repository(source) for source in self.config.sources
         ]
 
-    @staticmethod
-    def load_indexed() -> IndexedResource:
-        """return latest indexed resource"""
-        p = reduce(
-            lambda pre, cur: max(pre, cur, key=lambda f: f.stat().st_ctime),
-            [p for p in Path(f"{SAGASU_WORKDIR}/indexed").iterdir() if p.suffix == '.pkl'],
-        )
-
-        indexed_resource = pickle.load(p.absolute().open('rb'))
-        return indexed_resource
+    def load_indexed(self) -> Union[IndexedResource, SegmentedIndex]:
+        """return the live segments of the index, mapped from disk"""
+        index = self.segments.open()
+        return index if index is not None else IndexedResource(indexed={})
+
+    def _index_version(self) -> Optional[Tuple[str, int]]:
+        return self.segments.version()
+
+    def reload(self) -> bool:
+        """switch to the latest index on disk, unless it is the one being searched.
+
+        searches running meanwhile go on with the index they started with.
+        """
+        if (version := self._index_version()) == self.index_version:
+            return False
+        self.indexed_resource = self.load_indexed()
+        self.index_version = version
+        return True
+
+    def dump_indexed(self, indexed_resource: IndexedResource):
+        """replace the index on disk with a single segment of the whole index"""
+        self.segments.replace(indexed_resource)
+
+    def _apply(self, changes: Changes, changed: IndexedResource, registry: DocumentRegistry, dump: bool):
+        """update the index with the new or modified documents, without the stale ones.
+
+        an index on disk gets a segment of the changed documents only, the rest of it is left as it is.
+        """
+        if dump and isinstance(changes.index, SegmentedIndex):
+            self.segments.commit(registry.collapse(changed), changes.index.locations(changes.stale))
+            self.indexed_resource = self.load_indexed()
+            self.index_version = self._index_version()
+            self.segments.merge_in_background()
+            return
+        self.indexed_resource = registry.collapse(changes.kept().merge(changed))
+        if dump:
+            self.dump_indexed(self.indexed_resource)
 
     @staticmethod
     def load_repository(source: SourceModel) -> Repository:
@@ -53,90 +81,143 @@ class SearchEngine:
         elif source.source_type == "dummy":
             return DummyRepository()
 
-    def _load_all(self) -> List[Resource]:
-        resources = []
+    def _stream_all(self) -> Iterator[Resource]:
         for repository in self.repositories:
-            _resources = repository.load()
-            resources += _resources
-        return resources
+            yield from repository.stream()
 
     # experimental, will merge this into indexing
-    def reduce_indexing_stream(self, dump=True):
-        def _reduce_indexed_resources(r1: IndexedResource, r2: IndexedResource) -> IndexedResource:
-            for r in r1.indexed:
-                if r in r2.indexed:
-                    r2.indexed[r] += r1.indexed[r]
-                else:
-                    r2.indexed[r] = r1.indexed[r]
-            return r2
-
-        async def run_stream(_loop: asyncio.AbstractEventLoop, crawlers: List[Crawler]) -> List[IndexedResource]:
+    def reduce_indexing_stream(self, dump=True, incremental=True):
+        """crawl every source and index the crawled resources.
+
+        when incremental, only new or modified resources are tokenized, the rest of the
+        index is kept, and documents no longer found by their source are removed.
+        """
+        import asyncio
+
+        changes = Changes(self.indexed_resource if incremental else IndexedResource(indexed={}))
+        registry = DocumentRegistry()
+        # crawlers are indexed concurrently by a single pool of workers
+        executor = IndexingExecutor(self.indexers, self.config.workers)
+
+        async def run_stream(_loop: "asyncio.AbstractEventLoop", crawlers: List[Crawler]) -> List[IndexedResource]:
             async def _run_indexing_stream(crawler: Crawler):
-                return await _loop.run_in_executor(None, self.indexing_stream, crawler)
+                return await _loop.run_in_executor(None, self.indexing_stream, crawler, changes, registry, executor)
             return await asyncio.gather(*[_run_indexing_stream(crawler) for crawler in crawlers])
 
         loop = asyncio.get_event_loop()
         crawler_engine = CrawlerEngine(self.config.sources)
-        indexed_resources = loop.run_until_complete(run_stream(loop, crawler_engine.crawlers))
-        indexed_resource = reduce(_reduce_indexed_resources, indexed_resources)
-        self.indexed_resource = indexed_resource
-
+        for crawler in crawler_engine.crawlers:
+            # crawlers may skip resources which did not change, as long as the index has them
+            crawler.incremental = incremental and any(crawler.owns(uri) for uri in changes.uris())
+        with executor:
+            indexed_resources = loop.run_until_complete(run_stream(loop, crawler_engine.crawlers))
+        for crawler in crawler_engine.crawlers:
+            changes.remove_missing(crawler.crawled_uris(), crawler.owns)
+        changed = reduce(IndexedResource.merge, indexed_resources, IndexedResource(indexed={}))
+        self._apply(changes, changed, registry, dump)
         if dump:
-            mkdir_p(file_path := f"{SAGASU_WORKDIR}/indexed/{datetime.datetime.now(JST).strftime('%Y-%m-%d-%H')}.pkl")
-            with open(file_path, "wb") as f:
-                pickle.dump(indexed_resource, f)
-
-    def indexing_stream(self, crawler: Crawler) -> IndexedResource:
-        def _indexing(_indexer: Indexer, _resource: Resource) -> IndexedResource:
-            return _indexer(_resource, IndexedResource(indexed={}))
-
-        def _reduce_indexed_resources(r1: IndexedResource, r2: IndexedResource) -> IndexedResource:
-            for r in r1.indexed:
-                if r in r2.indexed:
-                    r2.indexed[r] += r1.indexed[r]
-                else:
-                    r2.indexed[r] = r1.indexed[r]
-            return r2
-
-        crawler()
-        resource_indexer_pairs = product(self.indexers, crawler.resources)
+            for crawler in crawler_engine.crawlers:
+                crawler.save_state()
+
+    def indexing_stream(
+        self,
+        crawler: Crawler,
+        changes: Optional[Changes] = None,
+        registry: Optional[DocumentRegistry] = None,
+        executor: Optional[IndexingExecutor] = None,
+    ) -> IndexedResource:
+        """index resources of the crawler while it is crawling.
+
+        resources already admitted to the registry by another crawler are not indexed again.
+        """
         print(f"start indexing: {crawler.source.source_type}")
-        jobs = [delayed(_indexing)(*resource_indexer_pair) for resource_indexer_pair in resource_indexer_pairs]
-        indexed_resources = Parallel(n_jobs=2)(jobs)
-        indexed_resource = reduce(_reduce_indexed_resources, indexed_resources)
-        print(f"done indexing: {crawler.source.source_type}")
+        resources = crawler.stream() if registry is None else registry.admit(crawler.stream())
+        resources = resources if changes is None else changes.stream(resources)
+        executor = executor or IndexingExecutor(self.indexers, self.config.workers)
+        indexed_resource = executor(resources)
+        print(f"done indexing: {crawler.source.source_type} ({len(indexed_resource)} new or modified)")
         return indexed_resource
 
-    def indexing(self, dump=True):
-        def _indexing(_indexer: Indexer, _resource: Resource) -> IndexedResource:
-            return _indexer(_resource, IndexedResource(indexed={}))
-
-        def _reduce_indexed_resources(r1: IndexedResource, r2: IndexedResource) -> IndexedResource:
-            for r in r1.indexed:
-                if r in r2.indexed:
-                    r2.indexed[r] += r1.indexed[r]
-                else:
-                    r2.indexed[r] = r1.indexed[r]
-            return r2
-
-        resources = self._load_all()
-        resource_indexer_pairs = product(self.indexers, resources)
-        jobs = [delayed(_indexing)(*resource_indexer_pair) for resource_indexer_pair in resource_indexer_pairs]
-        indexed_resources = Parallel(n_jobs=4)(jobs)
-        indexed_resource = reduce(_reduce_indexed_resources, indexed_resources)
-        self.indexed_resource = indexed_resource
+    def indexing(self, dump=True, incremental=False):
+        """index every stored resource, streamed from the repositories in chunks.
+
+        a uri stored by several sources is indexed once.
+        """
+        registry = DocumentRegistry()
+        resources = registry.admit(self._stream_all())
+        if incremental:
+            changes = Changes(self.indexed_resource)
+            changed = IndexingExecutor(self.indexers, self.config.workers)(changes.stream(resources))
+            changes.remove_missing(changes.seen, lambda uri: True)
+            self._apply(changes, changed, registry, dump)
+            return
+        self.indexed_resource = registry.collapse(IndexingExecutor(self.indexers, self.config.workers)(resources))
         if dump:
-            mkdir_p(file_path := f"{SAGASU_WORKDIR}/indexed/{datetime.datetime.now(JST).strftime('%Y-%m-%d-%H')}.pkl")
-            with open(file_path, "wb") as f:
-                pickle.dump(indexed_resource, f)
-        return
+            self.dump_indexed(self.indexed_resource)
 
     def word_search(self, word: str) -> List[Resource]:
         if {} == self.indexed_resource:
             raise Exception("run indexing before call searching")
-        elif word not in self.indexed_resource.indexed:
-            return []
-        return self.indexed_resource.indexed[word]
+        return self.indexed_resource.search(word)
+
+    def ranked_search(self, word: str, k: int = 10) -> List[Tuple[Resource, float]]:
+        """return the k best resources for the word, ordered by BM25 score.
+
+        a word which is not a term of the index is scored by its tokens.
+        """
+        index = self.indexed_resource
+        terms = [word] if word in index.indexed else tokenize(word)
+        ranked = BM25(index).top_k(terms, k)
+        return [(index.document(doc_id), score) for doc_id, score in ranked]
+
+    def query_search(self, query: str, k: int = 10) -> List[Tuple[Resource, float]]:
+        """evaluate an AND / OR / phrase query, and return the k best matched resources by BM25"""
+        return self.query_page(query, 0, k)[1]
+
+    def query_page(self, query: str, offset: int, limit: int) -> Tuple[int, List[Tuple[Resource, float]]]:
+        """evaluate a query, and return the number of matched resources and `limit` of them
+        from `offset`, in the order of BM25.
+
+        the index is read once, so that a query is not split across a reload.
+        """
+        index = self.indexed_resource
+        evaluator = QueryEvaluator(index, n=max(indexer.n for indexer in self.indexers))
+        parsed = parse(query, tokenize)
+        doc_ids = evaluator(parsed)
+        terms = [term for clause in parsed.clauses for phrase in clause for term in evaluator.terms(phrase)]
+        ranked = BM25(index).top_k(terms, offset + limit, candidates=doc_ids)[offset:]
+        return len(doc_ids), [(index.document(doc_id), score) for doc_id, score in ranked]
+
+    @property
+    def terms(self) -> TermDictionary:
+        """sorted dictionary of the terms of the index being searched, built on first use"""
+        index = self.indexed_resource
+        if (terms := self._terms) is None or terms[0] is not index:
+            terms = self._terms = (index, TermDictionary.from_index(index))
+        return terms[1]
+
+    def suggest(self, query: str, limit: int = 5) -> Dict[str, List[str]]:
+        """terms close to every word of the query which is not a term of the index"""
+        index = self.indexed_resource
+        terms = self.terms
+        words = ["".join(phrase.tokens) for clause in parse(query, tokenize).clauses for phrase in clause]
+        return {
+            word: terms.suggest(word, limit, weight=lambda term: len(index.postings(term)))
+            for word in words if word not in index.indexed
+        }
+
+    def grep(self, pattern: str, regex: bool = False, offset: int = 0, limit: int = 10) -> Tuple[int, List[Resource]]:
+        """find the resources containing the text, or matching the regular expression when `regex`,
+        and return the number of them and `limit` of them from `offset`, in the order of the index.
+
+        unlike a query, the text may start or end in the middle of a token.
+        """
+        index = self.indexed_resource
+        searcher = self._trigrams
+        if searcher is None or searcher.index is not index:
+            searcher = self._trigrams = TrigramSearcher.open(index)
+        doc_ids = searcher.regex(pattern) if regex else searcher.substring(pattern)
+        return len(doc_ids), [index.document(doc_id) for doc_id in doc_ids[offset: offset + limit]]
 
 
 class CrawlerEngine:
@@ -154,5 +235,4 @@ class CrawlerEngine:
 
     def crawl_all(self):
         for crawler in self.crawlers:
-            crawler()
-            self.resources += crawler.resources
+            self.resources += crawler.stream()
@@ -0,0 +1,146 @@
+import time
+from collections import deque
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple
+
+from sagasu.indexer import Indexer, get_nlp, tokenize_stream
+from sagasu.model import Resource, IndexedResource, SpooledDocuments
+
+_indexers: List[Indexer] = []
+
+
+def _init_worker(indexers: List[Indexer]):
+    # the GiNZA model is loaded once per worker, and the worker stays alive
+    # for every chunk of the run
+    global _indexers
+    _indexers = indexers
+    get_nlp()
+
+
+def _index_chunk(start: int, sentences: List[str]) -> IndexedResource:
+    """index a chunk of sentences, using the position in the whole run as document id.
+
+    the partial index holds postings, term frequencies and lengths only, resources stay
+    in the parent process.
+    """
+    partial = IndexedResource(indexed={})
+    for doc_id, tokens in enumerate(tokenize_stream(sentences), start):
+        partial.lengths.append(len(tokens))
+        for indexer in _indexers:
+            partial.add_postings(doc_id, indexer.terms(tokens))
+    return partial
+
+
+def _merge(left: IndexedResource, right: IndexedResource) -> IndexedResource:
+    """merge two partial indexes, every document id of `right` must follow those of `left`"""
+    if len(left.indexed) < len(right.indexed):
+        for term, doc_ids in left.indexed.items():
+            if term in right.indexed:
+                right.indexed[term] = doc_ids + right.indexed[term]
+                right.frequencies[term] = left.frequencies[term] + right.frequencies[term]
+            else:
+                right.indexed[term] = doc_ids
+                right.frequencies[term] = left.frequencies[term]
+        right.lengths = left.lengths + right.lengths
+        return right
+    for term, doc_ids in right.indexed.items():
+        if term in left.indexed:
+            left.indexed[term].extend(doc_ids)
+            left.frequencies[term].extend(right.frequencies[term])
+        else:
+            left.indexed[term] = doc_ids
+            left.frequencies[term] = right.frequencies[term]
+    left.lengths.extend(right.lengths)
+    return left
+
+
+def _context():
+    # crawlers and captioning run in threads, a process forked while they hold a lock may deadlock,
+    # workers are started from a fresh process instead
+    import multiprocessing
+
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+class IndexingExecutor:
+    """index resources with a pool of long-lived worker processes.
+
+    resources are shipped to workers in chunks of sentences, workers send back
+    partial indexes of document ids instead of resources, and the partial indexes
+    are merged as a binary tree while the run goes on.
+
+    within a `with` block, every call shares the same pool, so that crawlers indexed
+    concurrently do not start a pool each.
+    """
+
+    def __init__(self, indexers: List[Indexer], workers: int = 1, chunk_size: int = 128):
+        self.indexers = indexers
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._pool = None
+
+    def __enter__(self) -> "IndexingExecutor":
+        if self.workers > 1 and self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=_context(), initializer=_init_worker, initargs=(self.indexers,)
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _chunks(self, resources: Iterable[Resource], documents: SpooledDocuments) -> Iterator[Tuple[int, List[str]]]:
+        resources = iter(resources)
+        while chunk := list(islice(resources, self.chunk_size)):
+            start = len(documents)
+            documents.extend(chunk)
+            yield start, [resource.sentence for resource in chunk]
+
+    def _partials(self, chunks: Iterator[Tuple[int, List[str]]]) -> Iterator[IndexedResource]:
+        if self.workers <= 1:
+            _init_worker(self.indexers)
+            for chunk in chunks:
+                yield _index_chunk(*chunk)
+            return
+
+        if self._pool is None:
+            with self:
+                yield from self._partials(chunks)
+            return
+
+        # keep a bounded number of chunks in flight and collect them in order
+        futures = deque()
+        for chunk in chunks:
+            futures.append(self._pool.submit(_index_chunk, *chunk))
+            if len(futures) >= self.workers * 2:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+    def __call__(self, resources: Iterable[Resource]) -> IndexedResource:
+        # documents go to disk as they come, only postings are kept in memory
+        documents = SpooledDocuments()
+        # (height, partial) pairs, merged like a binary counter so that every
+        # merge combines partial indexes of a similar size
+        stack: List[Tuple[int, IndexedResource]] = []
+        started = time.perf_counter()
+        for partial in self._partials(self._chunks(resources, documents)):
+            height = 0
+            while stack and stack[-1][0] == height:
+                partial = _merge(stack.pop()[1], partial)
+                height += 1
+            stack.append((height, partial))
+
+        merged = IndexedResource(indexed={})
+        while stack:
+            merged = _merge(stack.pop()[1], merged)
+        merged.documents = documents
+        elapsed = time.perf_counter() - started
+        rate = len(documents) / elapsed if elapsed else 0
+        print(f"indexed {len(documents)} docs in {elapsed:.1f}s ({rate:.1f} docs/sec)")
+
+        return merged
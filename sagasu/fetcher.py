@@ -0,0 +1,97 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """space out requests of every thread, slowing down when the server pushes back"""
+
+    def __init__(self, rate: float, max_interval: float = 5.0):
+        self.min_interval = 1 / rate if rate > 0 else 0.0
+        self.max_interval = max_interval
+        self.interval = self.min_interval
+        self.next = time.monotonic()
+        self.slowed_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next)
+            self.next = at + self.interval
+        time.sleep(at - now)
+
+    def slow_down(self):
+        with self.lock:
+            now = time.monotonic()
+            # requests already in flight fail together, slow down once for all of them
+            if now - self.slowed_at < self.interval:
+                return
+            self.slowed_at = now
+            self.interval = min(max(self.interval * 2, 0.05), self.max_interval)
+            # forget slots reserved at the old pace, so waiting threads are not stuck behind them
+            self.next = min(self.next, now + self.interval)
+
+    def speed_up(self):
+        with self.lock:
+            self.interval = max(self.interval / 2, self.min_interval)
+
+
+class Fetcher:
+    """fetch urls with a bounded number of concurrent requests over a keep-alive session.
+
+    429 and 5xx responses and connection errors are retried with exponential backoff,
+    honoring Retry-After, and slow down the rate of every thread. a delay is at most
+    `max_delay` seconds, whatever the server asks for. once retries are exhausted, the
+    error is raised as `requests.HTTPError`.
+    """
+
+    def __init__(
+        self, concurrency: int = 4, rate: float = 2.0, retries: int = 5, backoff: float = 1.0, max_delay: float = 60.0
+    ):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.limiter = RateLimiter(rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_delay)
+        return min(self.backoff * 2 ** attempt, self.max_delay)
+
+    def get(self, url: str) -> requests.Response:
+        attempt = 0
+        while True:
+            self.limiter.wait()
+            try:
+                response = self.session.get(url, timeout=30)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.limiter.speed_up()
+                    return response
+                if attempt >= self.retries:
+                    response.raise_for_status()
+            self.limiter.slow_down()
+            time.sleep(self._delay(attempt, response))
+            attempt += 1
+
+    def map(self, urls: Iterable[str]) -> Iterator[requests.Response]:
+        """fetch urls concurrently, yielding responses in the order of the urls"""
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            yield from pool.map(self.get, urls)
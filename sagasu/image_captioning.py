@@ -1,6 +1,13 @@
+import io
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
 import requests
 import tensorflow as tf
 
+from sagasu.cache import ImageCache, digest
+
 
 class BahdanauAttention(tf.keras.Model):
     def __init__(self, units):
@@ -61,10 +68,8 @@ class RNNDecoder(tf.keras.Model):
         return tf.zeros((batch_size, self.units))
 
 
-def pre_processing(media_url: str):
-    image = tf.image.decode_image(
-        requests.get(media_url).content, channels=3, dtype=tf.float32
-    )
+def load_image(content: bytes):
+    image = tf.image.decode_image(content, channels=3, dtype=tf.float32)
     l = m if (m := max(image.shape)) > 224 else 224
     image = tf.image.resize_with_crop_or_pad(image, target_height=l, target_width=l)
     image = tf.image.resize(image, size=(224, 224))
@@ -72,52 +77,157 @@ def pre_processing(media_url: str):
     return image
 
 
-def image_captioning_from_url(media_url: str) -> str:
-    image = pre_processing(media_url)
-    return image_captioning(image)
-
-
-def image_captioning(image) -> str:
-    image_model = tf.keras.applications.MobileNetV2(
-        include_top=False, weights="imagenet", input_shape=[224, 224, 3]
-    )
-    new_input = image_model.input
-    hidden_layer = image_model.layers[-1].output
-
-    image_features_extract_model = tf.keras.Model(new_input, hidden_layer)
-    features = image_features_extract_model(image)
-    features = tf.reshape(features, (features.shape[0], -1, features.shape[3]))
-
-    enc = CNNEncoder(embedding_dim=256)
-    dec = RNNDecoder(embedding_dim=256, units=512, vocab_size=9880)
-
-    dec.load_weights("model/dec/dec_save_weights")
+def pre_processing(media_url: str):
+    return load_image(requests.get(media_url).content)
+
+
+@dataclass
+class PreparedImage:
+    """an image ready for the model, with whichever of its caption or features is cached"""
+    key: str
+    caption: Optional[str] = None
+    features: Optional[np.ndarray] = None
+    image: Optional[tf.Tensor] = None
+
+
+class ImageCaptioner:
+    """caption images with the feature extractor, the encoder and the decoder loaded once.
+
+    images are captioned in batches: features of the whole batch are extracted
+    at once, and the decoder advances every caption by one word per step until
+    each of them has produced `<end>`.
+
+    downloaded images, their features and captions are kept in the image cache,
+    so an image is only captioned once across crawls.
+    """
+
+    def __init__(
+        self,
+        model_dir: str = "model",
+        batch_size: int = 16,
+        max_length: int = 100,
+        cache: Optional[ImageCache] = None,
+    ):
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache = cache or ImageCache()
+
+        image_model = tf.keras.applications.MobileNetV2(
+            include_top=False, weights="imagenet", input_shape=[224, 224, 3]
+        )
+        self.image_features_extract_model = tf.keras.Model(
+            image_model.input, image_model.layers[-1].output
+        )
 
-    enc.load_weights("model/enc/enc_save_weights")
-    encoded = enc(features)
-    hidden = dec.reset_state(batch_size=1)
+        self.enc = CNNEncoder(embedding_dim=256)
+        self.dec = RNNDecoder(embedding_dim=256, units=512, vocab_size=9880)
+        self.enc.load_weights(f"{model_dir}/enc/enc_save_weights")
+        self.dec.load_weights(f"{model_dir}/dec/dec_save_weights")
+
+        with open(f"{model_dir}/tokenize/token.json") as f:
+            self.tokenizer = tf.keras.preprocessing.text.tokenizer_from_json(f.readline())
+        self.start = self.tokenizer.word_index["<start>"]
+        self.end = self.tokenizer.word_index["<end>"]
+
+    def features(self, images):
+        features = self.image_features_extract_model(images)
+        return tf.reshape(features, (features.shape[0], -1, features.shape[3]))
+
+    def decode(self, features) -> List[str]:
+        encoded = self.enc(features)
+
+        batch_size = features.shape[0]
+        hidden = self.dec.reset_state(batch_size=batch_size)
+        dec_input = tf.fill([batch_size, 1], self.start)
+        words: List[List[str]] = [[] for _ in range(batch_size)]
+        finished = np.zeros(batch_size, dtype=bool)
+
+        for _ in range(self.max_length):
+            predictions, hidden, _ = self.dec(dec_input, encoded, hidden)
+            predicted_ids = tf.random.categorical(predictions, 1)[:, 0].numpy()
+            for idx, predicted_id in enumerate(predicted_ids):
+                if finished[idx]:
+                    continue
+                if predicted_id == self.end:
+                    finished[idx] = True
+                else:
+                    words[idx].append(self.tokenizer.index_word.get(predicted_id, ""))
+            if finished.all():
+                break
+            dec_input = tf.expand_dims(predicted_ids, 1)
+        return ["".join(w) for w in words]
+
+    def __call__(self, images) -> List[str]:
+        """caption a batch of images shaped [batch, 224, 224, 3]"""
+        return self.decode(self.features(images))
+
+    def _download(self, media_url: str) -> bytes:
+        if (content := self.cache.images.get(media_url)) is None:
+            response = requests.get(media_url)
+            response.raise_for_status()
+            content = response.content
+            self.cache.images.put(media_url, content)
+        return content
+
+    def prepare(self, media_url: str) -> PreparedImage:
+        """download and preprocess an image, the part of captioning which needs no model.
+
+        an image captioned before only gets its caption, and an image whose
+        features were extracted before only gets its features.
+        """
+        content = self._download(media_url)
+        # the same image may be posted under several urls, so it is keyed by its content
+        key = digest(content)
+        if (caption := self.cache.captions.get(key)) is not None:
+            return PreparedImage(key, caption=caption.decode())
+        if (features := self.cache.features.get(key)) is not None:
+            return PreparedImage(key, features=np.load(io.BytesIO(features)))
+        return PreparedImage(key, image=load_image(content))
+
+    def caption_prepared(self, batch: List[PreparedImage]) -> List[str]:
+        """caption a batch of prepared images, which should not be captioned already"""
+        missing = [prepared for prepared in batch if prepared.features is None]
+        if missing:
+            computed = self.features(tf.concat([prepared.image for prepared in missing], axis=0))
+            for prepared, features in zip(missing, computed.numpy()):
+                buffer = io.BytesIO()
+                np.save(buffer, features)
+                self.cache.features.put(prepared.key, buffer.getvalue())
+                prepared.features = features
+        captions = self.decode(np.stack([prepared.features for prepared in batch]))
+        for prepared, caption in zip(batch, captions):
+            self.cache.captions.put(prepared.key, caption.encode())
+            prepared.caption = caption
+        return captions
+
+    def caption_urls(self, media_urls: List[str]) -> List[str]:
+        prepared = [self.prepare(url) for url in media_urls]
+        missing = [p for p in prepared if p.caption is None]
+        for idx in range(0, len(missing), self.batch_size):
+            self.caption_prepared(missing[idx: idx + self.batch_size])
+        return [p.caption for p in prepared]
+
+
+_captioner: Optional[ImageCaptioner] = None
+
+
+def get_captioner() -> ImageCaptioner:
+    global _captioner
+    if _captioner is None:
+        _captioner = ImageCaptioner()
+    return _captioner
 
-    with open("model/tokenize/token.json") as f:
-        s = f.readline()
-    tokenizer = tf.keras.preprocessing.text.tokenizer_from_json(s)
-    result = []
-    dec_input = tf.expand_dims([tokenizer.word_index["<start>"]], 0)
 
-    for i in range(100):
-        predictions, hidden, attention_weights = dec(dec_input, encoded, hidden)
+def image_captioning_from_url(media_url: str) -> str:
+    return get_captioner().caption_urls([media_url])[0]
 
-        predicted_id = tf.random.categorical(predictions, 1)[0][0].numpy()
-        result.append(tokenizer.index_word[predicted_id])
 
-        if tokenizer.index_word[predicted_id] == "<end>":
-            break
-        else:
-            dec_input = tf.expand_dims([predicted_id], 0)
-    return "".join(result)[:-5]
+def image_captioning(image) -> str:
+    return get_captioner()(image)[0]
 
 
 if __name__ == "__main__":
-    _images = tf.random.normal([1, 224, 224, 3])
+    _images = tf.random.normal([4, 224, 224, 3])
 
-    res = image_captioning(_images)
+    res = get_captioner()(_images)
     print(res)
@@ -0,0 +1,72 @@
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sagasu.model import IndexedResource, Resource, content_hash
+from sagasu.storage import URI_SECTIONS
+
+
+def uri_index(index):
+    """ids of the documents of an index by uri, as the postings of their uri.
+
+    mapped and segmented indexes have them stored, the documents of other indexes are read.
+    """
+    if hasattr(index, "has_terms") and index.has_terms(URI_SECTIONS):
+        return index.view(URI_SECTIONS)
+    uris = IndexedResource(indexed={})
+    for doc_id in range(len(index)):
+        uris.add_postings(doc_id, [index.document(doc_id).uri])
+    return uris
+
+
+class Changes:
+    """difference between an existing index and newly crawled resources.
+
+    only new or modified resources have to be tokenized, the other documents
+    are copied from the existing index with their postings.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        # documents and their hashes are read only for the uris crawled again
+        self.uri_index = uri_index(index)
+        self.stale: Set[int] = set()
+        # uris of every resource passed to `stream` or `changed`
+        self.seen: Set[str] = set()
+
+    def uris(self) -> Iterable[str]:
+        return self.uri_index.indexed.keys()
+
+    def _digest(self, uri: str) -> Optional[Tuple[int, bytes]]:
+        """id and hash of the document of a uri in the index, if any"""
+        if not len(doc_ids := self.uri_index.postings(uri)):
+            return None
+        return doc_ids[-1], self.index.document_hash(doc_ids[-1])
+
+    def stream(self, resources: Iterable[Resource]) -> Iterator[Resource]:
+        """yield resources which are new or modified, and mark their previous version as stale"""
+        for resource in resources:
+            self.seen.add(resource.uri)
+            digest = self._digest(resource.uri)
+            if digest is not None and digest[1] == content_hash(resource):
+                continue
+            if digest is not None:
+                self.stale.add(digest[0])
+            yield resource
+
+    def changed(self, resources: Iterable[Resource]) -> List[Resource]:
+        return list(self.stream(resources))
+
+    def remove(self, uris: Iterable[str]):
+        for uri in uris:
+            if len(doc_ids := self.uri_index.postings(uri)):
+                self.stale.add(doc_ids[-1])
+
+    def remove_missing(self, crawled: Set[str], owns: Callable[[str], bool]):
+        """remove documents owned by a source which has not crawled them this time"""
+        self.remove(uri for uri in self.uris() if owns(uri) and uri not in crawled)
+
+    def kept(self) -> IndexedResource:
+        """the existing index without stale documents"""
+        doc_ids = [doc_id for doc_id in range(len(self.index)) if doc_id not in self.stale]
+        # documents of an index in memory are copied as they are, those of a mapped one are read
+        documents = self.index.documents if isinstance(self.index, IndexedResource) else None
+        return IndexedResource.from_index(self.index, doc_ids, documents)
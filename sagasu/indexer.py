@@ -1,53 +1,90 @@
 import datetime
-import pickle
-from typing import List
+import threading
+from typing import Iterable, Iterator, List
 
-import spacy
-
-from sagasu.model import Resource, IndexedResource
+from sagasu.model import Resource, IndexedResource, TokenizedResource
+from sagasu.storage import write_index
 from sagasu.util import mkdir_p, SAGASU_WORKDIR, JST
 
-nlp = spacy.load("ja_ginza")
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def get_nlp():
+    """the GiNZA model, loaded on first use since loading it takes seconds"""
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            _nlp = spacy.load("ja_ginza")
+    return _nlp
+
+
+def preload():
+    """load the GiNZA model in the background, while the user is typing a query"""
+    threading.Thread(target=get_nlp, daemon=True).start()
+
+
+def tokenize(sentence: str) -> List[str]:
+    return [token.orth_ for token in get_nlp().make_doc(sentence)]
+
+
+def tokenize_stream(sentences: Iterable[str], batch_size: int = 256) -> Iterator[List[str]]:
+    """tokenize sentences in batches.
+
+    only `token.orth_` is used for indexing, so every pipeline component
+    (parser, NER, ...) is disabled and only the tokenizer runs.
+    """
+    nlp = get_nlp()
+    docs = nlp.pipe(sentences, batch_size=batch_size, disable=nlp.pipe_names)
+    for doc in docs:
+        yield [token.orth_ for token in doc]
+
+
+def n_gram(tokens: List[str], n: int = 1) -> List[str]:
+    return ["".join(tokens[idx: idx + n]) for idx in range(len(tokens) - n + 1)]
 
 
 def word_n_gram(sentence: str, n: int = 1) -> List[str]:
-    doc = nlp(sentence)
-    tokens = []
-    for sent in doc.sents:
-        for token in sent:
-            tokens.append(token.orth_)
-    index = ["".join(tokens[idx: idx + n]) for idx in range(len(tokens) - n + 1)]
-    return index
+    return n_gram(tokenize(sentence), n)
 
 
 def dump(func):
     def runner(*args, **kwargs):
         result = func(*args, **kwargs)
-        mkdir_p(file_path := f"{SAGASU_WORKDIR}/indexed/{datetime.datetime.now(JST).strftime('%Y-%m-%d-%H')}.pkl")
-        with open(file_path, "wb") as f:
-            pickle.dump(result, f)
+        mkdir_p(file_path := f"{SAGASU_WORKDIR}/indexed/{datetime.datetime.now(JST).strftime('%Y-%m-%d-%H')}.idx")
+        write_index(result, file_path)
         return result
 
     return runner
 
 
+class Tokenizer:
+    """parse a resource once, so that every indexer can share its tokens"""
+
+    def __call__(self, resource: Resource) -> TokenizedResource:
+        return TokenizedResource(index=tokenize(resource.sentence), resource=resource)
+
+
 class Indexer:
     def __call__(self, resource: Resource, indexed: IndexedResource) -> IndexedResource:
+        return self.index_tokenized(Tokenizer()(resource), indexed)
+
+    def terms(self, tokens: List[str]) -> List[str]:
         raise NotImplementedError("not implemented")
 
+    def index_tokenized(self, tokenized: TokenizedResource, indexed: IndexedResource) -> IndexedResource:
+        doc_id = indexed.add(tokenized.resource, len(tokenized.index))
+        indexed.add_postings(doc_id, self.terms(tokenized.index))
+        return indexed
+
 
 class WordNgramIndexer(Indexer):
     def __init__(self, n):
         self.n = n
 
-    def __call__(self, resource: Resource, indexed: IndexedResource) -> IndexedResource:
-        indices = word_n_gram(resource.sentence, self.n)
-        for index in indices:
-            if index not in indexed.indexed:
-                indexed.indexed[index] = [resource]
-            else:
-                indexed.indexed[index].append(resource)
-        return indexed
+    def terms(self, tokens: List[str]) -> List[str]:
+        return n_gram(tokens, self.n)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
 import datetime
+import hashlib
 import json
-from dataclasses import dataclass, asdict
-from typing import List, Union, Dict
+import shutil
+import tempfile
+import threading
+from array import array
+from collections.abc import Sequence as SequenceABC
+from dataclasses import dataclass, asdict, field
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence, Tuple, Union, Dict
 
 from sagasu.util import SAGASU_WORKDIR, mkdir_p
 
@@ -31,14 +37,199 @@ class TokenizedResource:
     resource: Resource
 
 
+class SpooledDocuments(SequenceABC):
+    """documents encoded into a temporary file instead of being kept in memory.
+
+    indexing a corpus larger than memory keeps its postings in memory, not its
+    documents. a document is decoded again whenever it is read.
+    """
+
+    def __init__(self, documents: Iterable[Resource] = ()):
+        self._file = tempfile.TemporaryFile()
+        # offsets of the documents in the file, followed by its size
+        self.offsets = array("Q", [0])
+        self._lock = threading.Lock()
+        self.extend(documents)
+
+    def append(self, resource: Resource):
+        encoded = encode_resource(resource)
+        with self._lock:
+            self._file.seek(self.offsets[-1])
+            self._file.write(encoded)
+            self.offsets.append(self.offsets[-1] + len(encoded))
+
+    def extend(self, documents: Iterable[Resource]):
+        if not isinstance(documents, SpooledDocuments) or documents is self:
+            for document in list(documents) if documents is self else documents:
+                self.append(document)
+            return
+        # encoded documents are copied as they are
+        with self._lock:
+            self._file.seek(self.offsets[-1])
+            documents.copy_to(self._file)
+            size = self.offsets[-1]
+            self.offsets.extend(size + offset for offset in documents.offsets[1:])
+
+    def __iadd__(self, documents: Iterable[Resource]) -> "SpooledDocuments":
+        self.extend(documents)
+        return self
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets[-1]
+
+    def encoded(self, doc_id: int) -> bytes:
+        with self._lock:
+            self._file.seek(self.offsets[doc_id])
+            return self._file.read(self.offsets[doc_id + 1] - self.offsets[doc_id])
+
+    def __getitem__(self, doc_id):
+        if isinstance(doc_id, slice):
+            return [self[i] for i in range(*doc_id.indices(len(self)))]
+        if doc_id < 0:
+            doc_id += len(self)
+        if not 0 <= doc_id < len(self):
+            raise IndexError(doc_id)
+        return resource_from_dict(json.loads(self.encoded(doc_id)))
+
+    def __iter__(self) -> Iterator[Resource]:
+        return (self[doc_id] for doc_id in range(len(self)))
+
+    def copy_to(self, f: BinaryIO):
+        """write every encoded document to a file, one after another"""
+        with self._lock:
+            self._file.seek(0)
+            shutil.copyfileobj(self._file, f)
+
+
 @dataclass
 class IndexedResource:
-    indexed: Dict[str, List[Resource]]
+    """inverted index.
+
+    each term maps to a sorted and deduplicated array of document ids, with the
+    number of occurrences of the term in each document at the same position of
+    `frequencies`. each resource is stored once in `documents` at the position
+    of its id, and its length in tokens in `lengths`.
+    """
+    indexed: Dict[str, array]
+    documents: List[Resource] = field(default_factory=list)
+    frequencies: Dict[str, array] = field(default_factory=dict)
+    lengths: array = field(default_factory=lambda: array("I"))
+
+    def add(self, resource: Resource, length: int = 0) -> int:
+        """register the resource and return its document id.
+
+        indexing the same resource with several indexers in a row reuses its id.
+        """
+        if self.documents and self.documents[-1].uri == resource.uri:
+            return len(self.documents) - 1
+        self.documents.append(resource)
+        self.lengths.append(length)
+        return len(self.documents) - 1
+
+    def add_postings(self, doc_id: int, terms: Iterable[str]):
+        """add terms of a document, documents have to be added in increasing order of id"""
+        for term in terms:
+            if term not in self.indexed:
+                self.indexed[term] = array("I", [doc_id])
+                self.frequencies[term] = array("I", [1])
+            elif self.indexed[term][-1] != doc_id:
+                self.indexed[term].append(doc_id)
+                self.frequencies[term].append(1)
+            else:
+                self.frequencies[term][-1] += 1
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def postings(self, term: str) -> array:
+        return self.indexed.get(term, array("I"))
+
+    def term_frequencies(self, term: str) -> array:
+        return self.frequencies.get(term, array("I"))
+
+    def term_bounds(self, term: str) -> Optional[Tuple[int, int]]:
+        """largest frequency of the term and shortest document having it, which bound its scores"""
+        if not (doc_ids := self.postings(term)):
+            return None
+        return max(self.frequencies[term]), min(self.lengths[doc_id] for doc_id in doc_ids)
+
+    def document(self, doc_id: int) -> Resource:
+        return self.documents[doc_id]
+
+    def document_length(self, doc_id: int) -> int:
+        return self.lengths[doc_id]
+
+    def document_hash(self, doc_id: int) -> bytes:
+        return content_hash(self.documents[doc_id])
+
+    def iter_postings(self) -> Iterator[Tuple[str, array, array]]:
+        for term, doc_ids in self.indexed.items():
+            yield term, doc_ids, self.frequencies[term]
+
+    def average_document_length(self) -> float:
+        return sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, term: str) -> List[Resource]:
+        return [self.documents[doc_id] for doc_id in self.postings(term)]
+
+    @classmethod
+    def from_index(
+        cls, index, doc_ids: Sequence[int], documents: Optional[Sequence[Resource]] = None
+    ) -> "IndexedResource":
+        """copy some documents of an index (IndexedResource or MappedIndex), renumbering them in order.
+
+        `documents` are the already decoded documents of the index, if any. documents which are
+        not in memory already are spooled, see `SpooledDocuments`.
+        """
+        remap = array("l", [-1]) * len(index)
+        for new_id, old_id in enumerate(doc_ids):
+            remap[old_id] = new_id
+        copied_documents = (documents[doc_id] if documents else index.document(doc_id) for doc_id in doc_ids)
+        copied = cls(
+            indexed={},
+            documents=list(copied_documents) if isinstance(documents, list) else SpooledDocuments(copied_documents),
+            lengths=array("I", (index.document_length(doc_id) for doc_id in doc_ids)),
+        )
+        unchanged = len(doc_ids) == len(index)
+        for term, postings, frequencies in index.iter_postings():
+            if unchanged:
+                copied.indexed[term] = array("I", postings)
+                copied.frequencies[term] = array("I", frequencies)
+                continue
+            kept = [(remap[doc_id], tf) for doc_id, tf in zip(postings, frequencies) if remap[doc_id] >= 0]
+            if kept:
+                copied.indexed[term] = array("I", (doc_id for doc_id, _ in kept))
+                copied.frequencies[term] = array("I", (tf for _, tf in kept))
+        return copied
+
+    def merge(self, other: "IndexedResource") -> "IndexedResource":
+        """append documents of the other index, shifting their ids after ours"""
+        offset = len(self.documents)
+        for term, doc_ids in other.indexed.items():
+            shifted = array("I", (doc_id + offset for doc_id in doc_ids))
+            if term in self.indexed:
+                self.indexed[term].extend(shifted)
+                self.frequencies[term].extend(other.frequencies[term])
+            else:
+                self.indexed[term] = shifted
+                self.frequencies[term] = array("I", other.frequencies[term])
+        if isinstance(other.documents, SpooledDocuments) and not isinstance(self.documents, SpooledDocuments):
+            self.documents = SpooledDocuments(self.documents)
+        self.documents += other.documents
+        self.lengths.extend(other.lengths)
+        return self
 
     def dump(self):
         mkdir_p(file_path := f"{SAGASU_WORKDIR}/indexed/{datetime.datetime.now(JST).strftime('%Y-%m-%d-%H')}.json")
         with open(file_path, "w") as f:
-            f.write(json.dumps(asdict(self)))
+            f.write(json.dumps({
+                "indexed": {term: doc_ids.tolist() for term, doc_ids in self.indexed.items()},
+                "documents": [asdict(document) for document in self.documents],
+            }))
 
 
 @dataclass
@@ -82,3 +273,33 @@ class DummyResource(Resource):
 
     def __eq__(self, other):
         return super().__eq__(other)
+
+
+RESOURCE_TYPES = {
+    resource_type.__name__: resource_type
+    for resource_type in [
+        Resource,
+        SampleResource,
+        TwitterResource,
+        ScrapboxResource,
+        SlackResource,
+        DummyResource,
+    ]
+}
+
+
+def resource_to_dict(resource: Resource) -> dict:
+    return {"type": type(resource).__name__, **asdict(resource)}
+
+
+def resource_from_dict(d: dict) -> Resource:
+    d = dict(d)
+    return RESOURCE_TYPES[d.pop("type")](**d)
+
+
+def encode_resource(resource: Resource) -> bytes:
+    return json.dumps(resource_to_dict(resource), ensure_ascii=False, sort_keys=True).encode()
+
+
+def content_hash(resource: Resource) -> bytes:
+    return hashlib.sha1(encode_resource(resource)).digest()
@@ -0,0 +1,55 @@
+"""operations on sorted posting lists of document ids"""
+import heapq
+from array import array
+from itertools import groupby
+from typing import List, Sequence
+
+
+def gallop(postings: Sequence[int], target: int, lo: int = 0) -> int:
+    """return the first position from `lo` whose document id is not less than target.
+
+    the step doubles until it passes the target, then the last step is binary searched,
+    so skipping over a long posting list costs O(log distance).
+    """
+    n = len(postings)
+    hi, step = lo, 1
+    while hi < n and postings[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    hi = min(hi, n)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if postings[mid] < target:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def intersect(lists: List[Sequence[int]]) -> array:
+    """documents in every posting list.
+
+    the shortest list drives and the others are galloped, so a very common
+    term only costs a few probes per document of the rarest one.
+    """
+    result = array("I")
+    if not lists:
+        return result
+    lists = sorted(lists, key=len)
+    positions = [0] * len(lists)
+    for doc_id in lists[0]:
+        for i in range(1, len(lists)):
+            positions[i] = gallop(lists[i], doc_id, positions[i])
+            if positions[i] == len(lists[i]):
+                return result
+            if lists[i][positions[i]] != doc_id:
+                break
+        else:
+            result.append(doc_id)
+    return result
+
+
+def union(lists: List[Sequence[int]]) -> array:
+    """documents in any of the posting lists"""
+    return array("I", (doc_id for doc_id, _ in groupby(heapq.merge(*lists))))
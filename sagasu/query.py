@@ -0,0 +1,74 @@
+"""boolean and phrase queries over the n-gram index.
+
+words separated by spaces are ANDed, `OR` separates alternatives and a quoted
+text is a phrase::
+
+    料理 "毎日の楽しみ" OR 散歩
+
+each word is tokenized with the indexing tokenizer and matched as a phrase of
+its tokens, so a word longer than the n-grams of the index still matches.
+"""
+import re
+from array import array
+from dataclasses import dataclass
+from typing import Callable, List, Sequence
+
+from sagasu.postings import intersect, union
+
+_ATOM = re.compile(r'"([^"]*)"|(\S+)')
+_SPACES = re.compile(r"\s")
+
+
+@dataclass
+class Phrase:
+    tokens: List[str]
+
+
+@dataclass
+class Query:
+    """alternatives (OR) of phrases which all have to match (AND)"""
+    clauses: List[List[Phrase]]
+
+
+def parse(text: str, tokenize: Callable[[str], List[str]]) -> Query:
+    clauses: List[List[Phrase]] = [[]]
+    for match in _ATOM.finditer(text):
+        quoted, word = match.groups()
+        if word == "OR":
+            clauses.append([])
+            continue
+        tokens = tokenize(quoted if quoted is not None else word)
+        if tokens:
+            clauses[-1].append(Phrase(tokens))
+    return Query([clause for clause in clauses if clause])
+
+
+class QueryEvaluator:
+    def __init__(self, index, n: int = 3):
+        """`n` is the longest n-gram of the index"""
+        self.index = index
+        self.n = n
+
+    def terms(self, phrase: Phrase) -> List[str]:
+        """index terms covering the phrase"""
+        tokens = phrase.tokens
+        if len(tokens) <= self.n:
+            return ["".join(tokens)]
+        return ["".join(tokens[idx: idx + self.n]) for idx in range(len(tokens) - self.n + 1)]
+
+    def _matches(self, doc_id: int, phrase: Phrase) -> bool:
+        return _SPACES.sub("", "".join(phrase.tokens)) in _SPACES.sub("", self.index.document(doc_id).sentence)
+
+    def clause(self, clause: List[Phrase]) -> Sequence[int]:
+        doc_ids = intersect([self.index.postings(term) for phrase in clause for term in self.terms(phrase)])
+        # n-grams of a long phrase may match apart from each other, so check the phrase
+        # itself, on the documents which have every term only
+        long_phrases = [phrase for phrase in clause if len(self.terms(phrase)) > 1]
+        if not long_phrases:
+            return doc_ids
+        return array("I", (
+            doc_id for doc_id in doc_ids if all(self._matches(doc_id, phrase) for phrase in long_phrases)
+        ))
+
+    def __call__(self, query: Query) -> Sequence[int]:
+        return union([self.clause(clause) for clause in query.clauses])
@@ -0,0 +1,111 @@
+"""BM25 ranking with MaxScore dynamic pruning.
+
+every term has an upper bound of the score it can add to a document, from its
+largest frequency and the shortest document having it. terms are scored one
+after another from the highest bound, and the k-th best score so far is a
+threshold the final k-th best score cannot be below:
+
+- once the bounds of the remaining terms add up to less than the threshold, a
+  document not scored yet cannot enter the k best, so the remaining posting
+  lists are only probed for the documents already scored
+- a document whose score and the bounds of the remaining terms add up to less
+  than the threshold is dropped
+
+a very common term such as a particle has a low idf and so a low bound, it is
+scored last and only probed for the few documents of the rarer terms.
+"""
+import heapq
+import math
+from collections import defaultdict
+from itertools import accumulate
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sagasu.postings import gallop
+
+# bounds are computed with the same floating point operations as scores, they are
+# inflated a little so that rounding never prunes a document which should be kept
+_SLACK = 1 + 1e-9
+
+
+class BM25:
+    """rank documents of an index (IndexedResource or MappedIndex) with Okapi BM25"""
+
+    def __init__(self, index, k1: float = 1.2, b: float = 0.75):
+        self.index = index
+        self.k1 = k1
+        self.b = b
+
+    def idf(self, document_frequency: int) -> float:
+        n = len(self.index)
+        return math.log(1 + (n - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def score(self, idf: float, tf: int, length: int, average_length: float) -> float:
+        norm = self.k1 * (1 - self.b + self.b * length / average_length)
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def bound(self, term: str, idf: float, average_length: float) -> float:
+        """the largest score the term adds to a document"""
+        bounds = self.index.term_bounds(term)
+        if bounds is None:
+            # tf / (tf + norm) is below 1 whatever the frequency and the length are
+            return idf * (self.k1 + 1)
+        # the score grows with the frequency and shrinks with the length
+        return self.score(idf, *bounds, average_length) * _SLACK
+
+    @staticmethod
+    def _positions(doc_ids: Sequence[int], candidates: Optional[Sequence[int]]) -> Iterable[int]:
+        """positions of the candidates in the posting list, galloping instead of scanning it"""
+        if candidates is None:
+            return range(len(doc_ids))
+        positions = []
+        position = 0
+        for doc_id in candidates:
+            position = gallop(doc_ids, doc_id, position)
+            if position == len(doc_ids):
+                break
+            if doc_ids[position] == doc_id:
+                positions.append(position)
+        return positions
+
+    @staticmethod
+    def _threshold(scores: Dict[int, float], k: int) -> float:
+        return heapq.nlargest(k, scores.values())[-1] if len(scores) >= k else 0.0
+
+    def top_k(
+        self, terms: List[str], k: int = 10, candidates: Optional[Sequence[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """return (document id, score) pairs of the k best documents, best first.
+
+        when sorted candidates are given, only those documents are scored.
+        documents of equal scores are ordered by id.
+        """
+        if k <= 0:
+            return []
+        average_length = self.index.average_document_length() or 1.0
+        postings = []
+        for term in set(terms):
+            doc_ids = self.index.postings(term)
+            if not len(doc_ids):
+                continue
+            idf = self.idf(len(doc_ids))
+            postings.append((self.bound(term, idf, average_length), idf, doc_ids, self.index.term_frequencies(term)))
+        postings.sort(key=itemgetter(0), reverse=True)
+        # rest[i] is the most the terms from i on add to a document
+        rest = list(accumulate(bound for bound, _, _, _ in reversed(postings)))[::-1]
+
+        scores: Dict[int, float] = defaultdict(float)
+        for i, (_, idf, doc_ids, tfs) in enumerate(postings):
+            if rest[i] < (threshold := self._threshold(scores, k)):
+                scores = defaultdict(float, {
+                    doc_id: score for doc_id, score in scores.items() if score + rest[i] >= threshold
+                })
+                positions = self._positions(doc_ids, sorted(scores))
+            else:
+                positions = self._positions(doc_ids, candidates)
+            for position in positions:
+                doc_id, tf = doc_ids[position], tfs[position]
+                norm = self.k1 * (1 - self.b + self.b * self.index.document_length(doc_id) / average_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        # a heap keeps only k candidates, instead of sorting every matched document
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
@@ -0,0 +1,48 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List
+
+from sagasu.model import IndexedResource, Resource, content_hash
+
+
+class DocumentRegistry:
+    """documents of an indexing run by uri, so that every uri is indexed once.
+
+    a resource seen before with the same content is dropped before it is tokenized.
+    a resource seen before with another content is newer and is indexed, and
+    `collapse` then drops every version of a uri but the last one.
+    the registry is shared by the crawlers indexed concurrently.
+    """
+
+    def __init__(self):
+        self.digests: Dict[str, bytes] = {}
+        self.duplicates = 0
+        self.lock = threading.Lock()
+
+    def admit(self, resources: Iterable[Resource]) -> Iterator[Resource]:
+        for resource in resources:
+            digest = content_hash(resource)
+            with self.lock:
+                if self.digests.get(resource.uri) == digest:
+                    self.duplicates += 1
+                    continue
+                self.digests[resource.uri] = digest
+            yield resource
+
+    def collapse(self, indexed_resource: IndexedResource) -> IndexedResource:
+        """keep one version of every uri of the index, the one admitted last"""
+        documents = indexed_resource.documents
+        versions: Dict[str, List[int]] = defaultdict(list)
+        for doc_id, document in enumerate(documents):
+            versions[document.uri].append(doc_id)
+        if len(versions) == len(documents):
+            return indexed_resource
+
+        doc_ids = []
+        for uri, ids in versions.items():
+            # partial indexes of concurrent crawlers are merged in the order of the crawlers,
+            # not in the order their resources were admitted
+            newest = [doc_id for doc_id in ids if content_hash(documents[doc_id]) == self.digests.get(uri)]
+            doc_ids.append((newest or ids)[-1])
+        print(f"dropped {len(documents) - len(doc_ids)} older versions of documents")
+        return IndexedResource.from_index(indexed_resource, sorted(doc_ids), documents)
@@ -0,0 +1,112 @@
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sagasu.dictionary import TermDictionary
+from sagasu.engine import SearchEngine
+from sagasu.indexer import preload
+from sagasu.model import Resource
+
+try:
+    import readline
+except ImportError:  # not available on Windows
+    readline = None
+
+PROMPT = "sagasu> "
+HELP = """type search words (AND by spaces, OR, "phrase"), tab completes a term of the index.
+  :grep <text>       documents containing the text, even within a token
+  :regex <pattern>   documents matching the regular expression
+  :reload  switch to the latest index
+  :quit    exit (or Ctrl-D)"""
+
+
+class TermCompleter:
+    """complete a word with the terms of the index starting with it.
+
+    `terms` returns the dictionary of the index being searched. it is called on every
+    completion, so the dictionary is built on the first TAB and follows a reloaded index.
+    """
+
+    def __init__(self, terms: Callable[[], TermDictionary], limit: int = 50):
+        self.terms = terms
+        self.limit = limit
+        self.matches: List[str] = []
+
+    def complete(self, prefix: str) -> List[str]:
+        return list(self.terms().prefix(prefix, self.limit))
+
+    def __call__(self, text: str, state: int) -> Optional[str]:
+        """readline completion function, called with increasing state until it returns None"""
+        if state == 0:
+            self.matches = self.complete(text) if text else []
+        return self.matches[state] if state < len(self.matches) else None
+
+
+def print_ranked(ranked: List[Tuple[Resource, float]]):
+    for resource, score in ranked:
+        print(f"""
+[URI]
+  {resource.uri}
+[Score]
+  {score:.3f}
+[Sentence]
+  {resource.sentence[:30]}...
+""")
+
+
+def print_suggestions(suggestions: Dict[str, List[str]]):
+    for word, terms in suggestions.items():
+        if terms:
+            print(f"{word}: did you mean {', '.join(terms)}?")
+
+
+def _install(completer: TermCompleter):
+    if readline is None:
+        return
+    readline.set_completer(completer)
+    # complete the word under the cursor, words being separated by spaces and quotes
+    readline.set_completer_delims(' \t\n"')
+    readline.parse_and_bind("tab: complete")
+
+
+def repl(search_engine: SearchEngine, top: int = 10, read: Callable[[str], str] = input):
+    """search many queries with the engine loaded once, until :quit or EOF"""
+    preload()
+    _install(TermCompleter(lambda: search_engine.terms))
+    print(HELP)
+    while True:
+        try:
+            line = read(PROMPT).strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+        if not line:
+            continue
+        if line in (":quit", ":q", ":exit"):
+            return
+        if line == ":reload":
+            search_engine.reload()
+            print(f"{len(search_engine.indexed_resource)} docs")
+            continue
+
+        command, _, argument = line.partition(" ")
+        if command in (":grep", ":regex") and argument:
+            started = time.perf_counter()
+            try:
+                total, resources = search_engine.grep(argument, regex=command == ":regex", limit=top)
+            except re.error as e:
+                print(f"invalid pattern: {e}")
+                continue
+            elapsed = time.perf_counter() - started
+            for resource in resources:
+                print(f"{resource.uri}\n  {resource.sentence[:60]}...")
+            print(f"{total} results, showing {len(resources)} ({elapsed * 1000:.1f}ms)")
+            continue
+
+        started = time.perf_counter()
+        total, ranked = search_engine.query_page(line, 0, top)
+        elapsed = time.perf_counter() - started
+        print_ranked(ranked)
+        print(f"{total} results, showing {len(ranked)} ({elapsed * 1000:.1f}ms)")
+        if not total:
+            print_suggestions(search_engine.suggest(line))
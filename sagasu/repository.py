@@ -1,7 +1,4 @@
-from pathlib import Path
-from typing import List
-
-import pandas as pd
+from typing import Iterator, List
 
 from sagasu import crawler as c
 from sagasu import model as m
@@ -9,9 +6,13 @@ from sagasu import util as u
 
 
 class Repository:
-    def load(self) -> List[m.Resource]:
+    def stream(self) -> Iterator[m.Resource]:
+        """yield stored resources lazily, so that they are indexed without being loaded all at once"""
         raise NotImplementedError("")
 
+    def load(self) -> List[m.Resource]:
+        return list(self.stream())
+
 
 class SampleRepository(Repository):
     def __init__(self):
@@ -21,105 +22,24 @@ class SampleRepository(Repository):
 親譲りの無鉄砲で小供の時から損ばかりしている。
 """)
 
-    def load(self) -> List[m.SampleResource]:
+    def stream(self) -> Iterator[m.SampleResource]:
         with open(p := f"{u.SAGASU_WORKDIR}/sample/sample.txt") as f:
             document = f.readlines()
             document = "".join(document)
-        return [m.SampleResource(uri=p, sentence=document)]
+        yield m.SampleResource(uri=p, sentence=document)
 
 
 class TwitterRepository(Repository):
-    def load(self) -> List[m.TwitterResource]:
-        dir_path = Path(f"{c.CRAWLER_WORK_DIR}/twitter/uri-sentence")
-        uri_sentence_dfs = []
-        for file in dir_path.iterdir():
-            if not file.is_file():
-                continue
-            df = pd.read_csv(file, sep="\t")
-            uri_sentence_dfs.append(df)
-        uri_sentence_df = pd.concat(uri_sentence_dfs).reset_index()
-
-        dir_path = Path(f"{c.CRAWLER_WORK_DIR}/twitter/uri-media")
-        uri_media_dfs = []
-        for file in dir_path.iterdir():
-            if not file.is_file():
-                continue
-            df = pd.read_csv(file, sep="\t")
-            uri_media_dfs.append(df)
-        uri_media_df = pd.concat(uri_media_dfs).reset_index()
-
-        df = pd.merge(uri_sentence_df, uri_media_df)
-        # media_url1  media_url2  media_url3  media_url4  media_caption1
-        resources = [
-            m.TwitterResource(
-                uri=r[1].uri,
-                sentence=r[1].sentence,
-                image_urls=[
-                    r[1].media_url1,
-                    r[1].media_url2,
-                    r[1].media_url3,
-                    r[1].media_url4,
-                ],
-                image_captions=[
-                    r[1].media_caption1,
-                    r[1].media_caption2,
-                    r[1].media_caption3,
-                    r[1].media_caption4,
-                ],
-            )
-            for r in df.iterrows()
-        ]
-
-        return resources
+    def stream(self) -> Iterator[m.TwitterResource]:
+        return c.snapshot(f"{c.CRAWLER_WORK_DIR}/twitter", m.TwitterResource).stream()
 
 
 class ScrapboxRepository(Repository):
-    def load(self) -> List[m.ScrapboxResource]:
-        dir_path = Path(f"{c.CRAWLER_WORK_DIR}/scrapbox/uri-sentence")
-        uri_sentence_dfs = []
-        for file in dir_path.iterdir():
-            if not file.is_file():
-                continue
-            df = pd.read_csv(file, sep="\t")
-            uri_sentence_dfs.append(df)
-        uri_sentence_df = pd.concat(uri_sentence_dfs).reset_index()
-
-        dir_path = Path(f"{c.CRAWLER_WORK_DIR}/scrapbox/uri-media")
-        uri_media_dfs = []
-        for file in dir_path.iterdir():
-            if not file.is_file():
-                continue
-            df = pd.read_csv(file, sep="\t")
-            uri_media_dfs.append(df)
-        uri_media_df = pd.concat(uri_media_dfs).reset_index()
-
-        df = pd.merge(uri_sentence_df, uri_media_df)
-        # media_url1  media_url2  media_url3  media_url4  media_caption1
-        resources = [
-            m.ScrapboxResource(
-                uri=r[1].uri,
-                sentence=r[1].sentence,
-                image_urls=[
-                    r[1].media_url1,
-                    r[1].media_url2,
-                    r[1].media_url3,
-                    r[1].media_url4,
-                ],
-                image_captions=[
-                    r[1].media_caption1,
-                    r[1].media_caption2,
-                    r[1].media_caption3,
-                    r[1].media_caption4,
-                ],
-            )
-            for r in df.iterrows()
-        ]
-
-        return resources
+    def stream(self) -> Iterator[m.ScrapboxResource]:
+        return c.snapshot(f"{c.CRAWLER_WORK_DIR}/scrapbox", m.ScrapboxResource).stream()
 
 
 class DummyRepository(Repository):
-    def load(self) -> List[m.Resource]:
-        return [
-            m.DummyResource(uri="dummy", sentence="dummy"),
-            m.DummyResource(uri="dummy2", sentence="this is a dummy resource")]
+    def stream(self) -> Iterator[m.Resource]:
+        yield m.DummyResource(uri="dummy", sentence="dummy")
+        yield m.DummyResource(uri="dummy2", sentence="this is a dummy resource")
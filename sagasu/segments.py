@@ -0,0 +1,526 @@
+"""index made of immutable segments, updated by adding a segment instead of rewriting the whole index.
+
+::
+
+    indexed/segments/
+        manifest.json   the live segments in order, with the deleted documents of each
+        00000000.idx    a segment, an index file (see `sagasu.storage`)
+        ...
+
+an update writes the new and modified documents to a new segment, and marks
+their previous versions and the removed documents as deleted in the segments
+having them, so it costs in proportion to the change instead of the corpus. the
+manifest is replaced at once, a reader sees the index either before or after an
+update. a search goes through every segment, skipping the deleted documents.
+
+a background thread merges `merge_factor` adjacent segments of about the same
+size into one, and rewrites a segment whose documents are mostly deleted, so
+there are few segments however many updates there were. segments are never
+modified, a merge writes a new one and replaces the merged ones in the manifest.
+
+a single process updates the index, any number of them may search it.
+"""
+import copy
+import json
+import os
+import shutil
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from collections.abc import Mapping
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache, reduce
+from heapq import merge
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from sagasu.codec import BLOCK_SIZE
+from sagasu.model import IndexedResource, Resource
+from sagasu.storage import MappedIndex, latest_index, write_index
+from sagasu.trigram import build as build_trigrams
+
+MANIFEST = "manifest.json"
+# posting lists gathered across segments, kept for the terms searched most recently
+_GATHERED_LISTS = 256
+
+
+@dataclass
+class SegmentEntry:
+    name: str
+    documents: int
+    # ids of the deleted documents, within the segment
+    deleted: List[int] = field(default_factory=list)
+
+    @property
+    def live(self) -> int:
+        return self.documents - len(self.deleted)
+
+
+@dataclass
+class Manifest:
+    segments: List[SegmentEntry]
+    # number of the next segment file, names are never reused
+    next: int = 0
+
+    @classmethod
+    def load(cls, path: Path) -> "Manifest":
+        with open(path) as f:
+            d = json.load(f)
+        return cls([SegmentEntry(**entry) for entry in d["segments"]], d["next"])
+
+    def save(self, path: Path):
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"version": 1, "next": self.next, "segments": [asdict(entry) for entry in self.segments]}, f)
+        os.replace(tmp, path)
+
+
+class _Postings(Mapping):
+    """terms of a segmented index, to posting lists of its live documents"""
+
+    def __init__(self, index: "SegmentedIndex"):
+        self._index = index
+
+    def __getitem__(self, term: str) -> Sequence[int]:
+        doc_ids = self._index.postings(term)
+        if not len(doc_ids):
+            raise KeyError(term)
+        return doc_ids
+
+    def __contains__(self, term) -> bool:
+        return isinstance(term, str) and len(self._index.postings(term)) > 0
+
+    def __iter__(self) -> Iterator[str]:
+        return (term for term, _, _ in self._index.iter_postings())
+
+    def __len__(self) -> int:
+        index = self._index
+        # terms of deleted documents only are not counted, which takes gathering their postings
+        if any(entry.deleted for entry in index.entries):
+            return sum(1 for _ in self)
+        if len(index.segments) == 1:
+            return index.segments[0].term_count
+        return sum(1 for _ in index.terms())
+
+
+def _array(values: Sequence[int]) -> array:
+    return values if isinstance(values, array) else array("I", memoryview(values).tobytes())
+
+
+class SegmentedIndex:
+    """the live documents of segments as a single index, numbered in the order of the segments.
+
+    it has the interface of MappedIndex, and is searched the same way.
+    """
+
+    def __init__(self, segments: List[MappedIndex], entries: List[SegmentEntry]):
+        """opening costs in proportion to the segments and their deleted documents, not to the documents"""
+        self.segments = segments
+        self.entries = entries
+        # the first id of every segment
+        self.starts = array("q")
+        # sorted ids of the deleted documents of every segment, within the segment
+        self._deleted: List[array] = []
+        count = total_length = 0
+        for segment, entry in zip(segments, entries):
+            self.starts.append(count)
+            deleted = array("q", sorted(entry.deleted))
+            self._deleted.append(deleted)
+            count += len(segment) - len(deleted)
+            total_length += segment.total_length() - sum(segment.document_length(doc_id) for doc_id in deleted)
+        self._count = count
+        self._total_length = total_length
+        # lengths of every document, only when asked for all of them
+        self._lengths: Optional[array] = None
+        self._bind()
+
+    def _bind(self):
+        self.indexed = _Postings(self)
+        self._gathered_postings = lru_cache(maxsize=_GATHERED_LISTS)(self._gather_postings)
+        self._gathered_frequencies = lru_cache(maxsize=_GATHERED_LISTS)(self._gather_frequencies)
+
+    def has_terms(self, names: Tuple[bytes, ...]) -> bool:
+        return bool(self.segments) and all(segment.has_terms(names) for segment in self.segments)
+
+    def view(self, names: Tuple[bytes, ...]) -> "SegmentedIndex":
+        """the same segments with another term dictionary, see `MappedIndex.view`"""
+        view = copy.copy(self)
+        view.segments = [segment.view(names) for segment in self.segments]
+        view._bind()
+        return view
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _locate(self, doc_id: int) -> Tuple[int, int]:
+        """the segment of a document, and its id within the segment"""
+        s = bisect_right(self.starts, doc_id) - 1
+        offset = doc_id - self.starts[s]
+        deleted = self._deleted[s]
+        # the id is the offset, shifted by every deleted document up to it
+        local_id = offset
+        while (shifted := offset + bisect_right(deleted, local_id)) != local_id:
+            local_id = shifted
+        return s, local_id
+
+    def locations(self, doc_ids: Iterable[int]) -> Dict[str, List[int]]:
+        """ids within their segments of documents, by segment name"""
+        locations: Dict[str, List[int]] = defaultdict(list)
+        for doc_id in doc_ids:
+            s, local_id = self._locate(doc_id)
+            locations[self.entries[s].name].append(local_id)
+        return dict(locations)
+
+    def _select(self, s: int, doc_ids: Sequence[int], values: Optional[Sequence[int]] = None) -> array:
+        """ids of the live documents among those of a segment, or the values of them when given"""
+        start, deleted = self.starts[s], self._deleted[s]
+        if not deleted:
+            if values is not None:
+                return _array(values)
+            if not start:
+                return _array(doc_ids)
+            if len(doc_ids) <= BLOCK_SIZE:
+                return array("I", (doc_id + start for doc_id in doc_ids))
+            import numpy as np
+
+            return array("I", (np.asarray(doc_ids, dtype=np.uint32) + np.uint32(start)).tobytes())
+        # a live document is numbered after the live documents before it
+        if len(doc_ids) <= BLOCK_SIZE:
+            selected = array("I")
+            for n, doc_id in enumerate(doc_ids):
+                rank = bisect_left(deleted, doc_id)
+                if rank == len(deleted) or deleted[rank] != doc_id:
+                    selected.append(start + doc_id - rank if values is None else values[n])
+            return selected
+        import numpy as np
+
+        deleted_ids = np.frombuffer(deleted, dtype=np.int64)
+        ids = np.asarray(doc_ids, dtype=np.int64)
+        ranks = np.searchsorted(deleted_ids, ids)
+        live = deleted_ids[np.minimum(ranks, len(deleted_ids) - 1)] != ids
+        selected = (ids - ranks + start)[live] if values is None else np.asarray(values, dtype=np.uint32)[live]
+        return array("I", selected.astype(np.uint32).tobytes())
+
+    def _gather(self, term: str, frequencies: bool) -> Sequence[int]:
+        if len(self.segments) == 1 and not self._deleted[0]:
+            segment = self.segments[0]
+            return segment.term_frequencies(term) if frequencies else segment.postings(term)
+        gathered = array("I")
+        for s, segment in enumerate(self.segments):
+            if not len(doc_ids := segment.postings(term)):
+                continue
+            gathered += self._select(s, doc_ids, segment.term_frequencies(term) if frequencies else None)
+        return gathered
+
+    def _gather_postings(self, term: str) -> Sequence[int]:
+        return self._gather(term, frequencies=False)
+
+    def _gather_frequencies(self, term: str) -> Sequence[int]:
+        return self._gather(term, frequencies=True)
+
+    def terms(self) -> Iterator[str]:
+        """terms of every segment in sorted order, including those of deleted documents only"""
+        return (term for term, _ in groupby(merge(*(segment.terms() for segment in self.segments))))
+
+    def postings(self, term: str) -> Sequence[int]:
+        return self._gathered_postings(term)
+
+    def term_frequencies(self, term: str) -> Sequence[int]:
+        return self._gathered_frequencies(term)
+
+    def term_bounds(self, term: str) -> Optional[Tuple[int, int]]:
+        # bounds of deleted documents are kept until a merge, they are still bounds
+        bounds = []
+        for segment in self.segments:
+            if term not in segment.indexed:
+                continue
+            if (segment_bounds := segment.term_bounds(term)) is None:
+                return None
+            bounds.append(segment_bounds)
+        if not bounds:
+            return None
+        return max(tf for tf, _ in bounds), min(length for _, length in bounds)
+
+    def document_length(self, doc_id: int) -> int:
+        s, local_id = self._locate(doc_id)
+        return self.segments[s].document_length(local_id)
+
+    def document_lengths(self) -> Sequence[int]:
+        if self._lengths is None:
+            lengths = array("I")
+            for segment, deleted in zip(self.segments, self._deleted):
+                if not deleted:
+                    lengths.frombytes(memoryview(segment.document_lengths()).tobytes())
+                    continue
+                removed = set(deleted)
+                segment_lengths = segment.document_lengths()
+                lengths.extend(segment_lengths[doc_id] for doc_id in range(len(segment)) if doc_id not in removed)
+            self._lengths = lengths
+        return self._lengths
+
+    def average_document_length(self) -> float:
+        return self._total_length / self._count if self._count else 0.0
+
+    def document_hash(self, doc_id: int) -> bytes:
+        s, local_id = self._locate(doc_id)
+        return self.segments[s].document_hash(local_id)
+
+    def iter_postings(self) -> Iterator[Tuple[str, Sequence[int], Sequence[int]]]:
+        # every list is gathered once, it does not take the place of the lists of queries in the cache
+        for term in self.terms():
+            if len(doc_ids := self._gather_postings(term)):
+                yield term, doc_ids, self._gather_frequencies(term)
+
+    def document(self, doc_id: int) -> Resource:
+        s, local_id = self._locate(doc_id)
+        return self.segments[s].document(local_id)
+
+    @property
+    def documents(self) -> List[Resource]:
+        return [self.document(doc_id) for doc_id in range(len(self))]
+
+    def search(self, term: str) -> List[Resource]:
+        return [self.document(doc_id) for doc_id in self.postings(term)]
+
+    def dump(self):
+        IndexedResource.from_index(self, range(len(self))).dump()
+
+
+class Segments:
+    """segments of the index under a directory, and the updates and merges of them"""
+
+    def __init__(self, directory: str, merge_factor: int = 4):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / MANIFEST
+        self.merge_factor = merge_factor
+        # updates and merges replace the manifest one at a time
+        self.lock = threading.Lock()
+        self._next = 0
+        # segments being written, not to be collected as garbage
+        self._writing: Set[str] = set()
+        # segments merged away, to the merged segment and the ids of their documents in it,
+        # for updates computed against an index opened before the merge. an adopted legacy
+        # index keeps its ids
+        self._merged: Dict[str, Tuple[str, Optional[array]]] = {}
+        self._merger: Optional[threading.Thread] = None
+
+    def _path(self, name: str) -> Path:
+        return self.directory / name
+
+    def _allocate(self, manifest: Manifest) -> str:
+        n = max(manifest.next, self._next)
+        self._next = manifest.next = n + 1
+        self._writing.add(name := f"{n:08d}.idx")
+        return name
+
+    def _read(self) -> Manifest:
+        """the current manifest, read only, empty when there is none yet"""
+        if self.manifest_path.exists():
+            return Manifest.load(self.manifest_path)
+        return Manifest([])
+
+    def _legacy(self) -> Optional[Path]:
+        """the latest index written before the index was segmented, if any"""
+        return latest_index(str(self.directory.parent))
+
+    def outdated(self) -> Optional[Path]:
+        """the latest index pickled by a sagasu older than index files, when there is no other index.
+
+        it cannot be read, the index has to be built again.
+        """
+        if self.manifest_path.exists() or self._legacy() is not None or not self.directory.parent.exists():
+            return None
+        paths = [p for p in self.directory.parent.iterdir() if p.suffix == ".pkl"]
+        return max(paths, key=lambda p: p.stat().st_ctime, default=None)
+
+    def _adopt(self, manifest: Manifest):
+        """make the legacy index the first segment, when an update is about to write the first manifest"""
+        if manifest.segments or self.manifest_path.exists() or (legacy := self._legacy()) is None:
+            return
+        path = self._path(name := self._allocate(manifest))
+        try:
+            os.link(legacy, path)
+        except OSError:
+            shutil.copyfile(legacy, path)
+        manifest.segments.append(SegmentEntry(name, len(MappedIndex(str(path)))))
+        # an index opened before has the legacy index as a segment, with the same document ids
+        self._merged[legacy.name] = (name, None)
+
+    def _save(self, manifest: Manifest):
+        """replace the manifest, and remove the files of segments it no longer has"""
+        manifest.segments = [entry for entry in manifest.segments if entry.live]
+        manifest.save(self.manifest_path)
+        self._writing.difference_update(entry.name for entry in manifest.segments)
+        kept = {entry.name for entry in manifest.segments} | self._writing
+        for path in self.directory.iterdir():
+            if path.suffix == ".idx" and path.name not in kept:
+                try:
+                    # readers having it mapped go on with it
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def _write(self, indexed_resource: IndexedResource, name: str):
+        write_index(indexed_resource, str(self._path(name)), trigrams=build_trigrams(indexed_resource.documents))
+
+    def version(self) -> Optional[Tuple[str, int]]:
+        # the manifest is replaced on every update, its mtime tells versions apart
+        try:
+            return str(self.manifest_path), self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def open(self) -> Optional[SegmentedIndex]:
+        """the index of the live segments, None when there is none yet.
+
+        nothing is written, a legacy index is searched as it is until the next update adopts it.
+        """
+        for attempt in range(3):
+            manifest = self._read()
+            if not manifest.segments:
+                if self.manifest_path.exists() or (legacy := self._legacy()) is None:
+                    return None
+                segment = MappedIndex(str(legacy))
+                return SegmentedIndex([segment], [SegmentEntry(legacy.name, len(segment))])
+            try:
+                return SegmentedIndex(
+                    [MappedIndex(str(self._path(entry.name))) for entry in manifest.segments], manifest.segments
+                )
+            except FileNotFoundError:
+                # a merge has removed a segment since the manifest was read, and replaced the manifest
+                if attempt == 2:
+                    raise
+
+    def replace(self, indexed_resource: IndexedResource):
+        """replace every segment with a single one of the whole index"""
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            manifest = self._read()
+            self._write(indexed_resource, name := self._allocate(manifest))
+            manifest.segments = [SegmentEntry(name, len(indexed_resource))]
+            self._save(manifest)
+
+    def _forward(self, name: str, doc_ids: Iterable[int]) -> Tuple[str, List[int]]:
+        """segment name and ids of documents of a segment which may have been merged since"""
+        doc_ids = list(doc_ids)
+        while name in self._merged:
+            name, remap = self._merged[name]
+            if remap is not None:
+                doc_ids = [remap[doc_id] for doc_id in doc_ids if remap[doc_id] >= 0]
+        return name, doc_ids
+
+    def commit(self, added: IndexedResource, deleted: Dict[str, List[int]]):
+        """add a segment of new documents, and delete documents given by their ids within their segments"""
+        if not len(added) and not any(deleted.values()):
+            return
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            manifest = self._read()
+            self._adopt(manifest)
+            entries = {entry.name: entry for entry in manifest.segments}
+            for name, doc_ids in deleted.items():
+                name, doc_ids = self._forward(name, doc_ids)
+                # a segment no longer found has been replaced by a rebuild of the whole index
+                if (entry := entries.get(name)) is not None:
+                    entry.deleted = sorted(set(entry.deleted).union(doc_ids))
+            if len(added):
+                self._write(added, name := self._allocate(manifest))
+                manifest.segments.append(SegmentEntry(name, len(added)))
+            self._save(manifest)
+        print(f"committed a segment of {len(added)} documents, deleted {sum(map(len, deleted.values()))}")
+
+    def _tier(self, documents: int) -> int:
+        tier = 0
+        while documents >= self.merge_factor:
+            documents //= self.merge_factor
+            tier += 1
+        return tier
+
+    def _pick(self, manifest: Manifest) -> Optional[List[str]]:
+        """names of the segments to merge next, if any"""
+        for entry in manifest.segments:
+            if entry.deleted and entry.live * 2 < entry.documents:
+                return [entry.name]
+        tiers = [self._tier(entry.live) for entry in manifest.segments]
+        for start in range(len(tiers) - self.merge_factor + 1):
+            if len(set(tiers[start: start + self.merge_factor])) == 1:
+                return [entry.name for entry in manifest.segments[start: start + self.merge_factor]]
+        return None
+
+    def merge(self, names: List[str]) -> bool:
+        """merge adjacent segments into one without their deleted documents.
+
+        updates may be committed meanwhile, documents they delete from the merged
+        segments are deleted from the new one.
+        """
+        with self.lock:
+            manifest = self._read()
+            entries = [entry for entry in manifest.segments if entry.name in names]
+            if len(entries) != len(names):
+                return False
+            deleted = {entry.name: set(entry.deleted) for entry in entries}
+            name = self._allocate(manifest)
+
+        parts = []
+        remaps = {}
+        count = 0
+        for entry in entries:
+            segment = MappedIndex(str(self._path(entry.name)))
+            doc_ids = [doc_id for doc_id in range(len(segment)) if doc_id not in deleted[entry.name]]
+            remap = remaps[entry.name] = array("q", [-1]) * len(segment)
+            for new_id, old_id in enumerate(doc_ids, count):
+                remap[old_id] = new_id
+            parts.append(IndexedResource.from_index(segment, doc_ids))
+            count += len(doc_ids)
+        merged = reduce(IndexedResource.merge, parts)
+        self._write(merged, name)
+
+        with self.lock:
+            manifest = self._read()
+            current = {entry.name: entry for entry in manifest.segments}
+            if any(entry.name not in current for entry in entries):
+                # the whole index has been rebuilt meanwhile
+                self._writing.discard(name)
+                self._save(manifest)
+                return False
+            position = manifest.segments.index(current[entries[0].name])
+            deleted_since = sorted(
+                remaps[entry.name][doc_id]
+                for entry in entries for doc_id in set(current[entry.name].deleted) - deleted[entry.name]
+            )
+            manifest.segments = [entry for entry in manifest.segments if entry.name not in names]
+            if len(merged) - len(deleted_since):
+                manifest.segments.insert(position, SegmentEntry(name, len(merged), deleted_since))
+                self._merged.update((entry.name, (name, remaps[entry.name])) for entry in entries)
+            else:
+                # every merged document has been deleted meanwhile, the merged segment is collected
+                self._writing.discard(name)
+            self._save(manifest)
+        print(f"merged {len(entries)} segments into {name} ({len(merged)} documents)")
+        return True
+
+    def compact(self):
+        """merge segments until the merge policy picks none"""
+        while (names := self._pick(self._read())) is not None:
+            if not self.merge(names):
+                return
+
+    def merge_in_background(self):
+        with self.lock:
+            if self._merger is not None and self._merger.is_alive():
+                return
+            self._merger = threading.Thread(target=self._compact, name="sagasu-merge")
+            self._merger.start()
+
+    def _compact(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"failed to merge segments: {e!r}")
+
+    def wait(self):
+        """wait for the background merge, if any"""
+        if (merger := self._merger) is not None:
+            merger.join()
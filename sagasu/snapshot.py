@@ -0,0 +1,223 @@
+"""columnar snapshots of crawled resources.
+
+a snapshot is one file per source, made of batches appended by every crawl.
+a batch is a length-prefixed npz of typed columns::
+
+    uri, sentence                   text columns
+    media_count                     int32, number of images of every resource
+    media_url, media_caption        text columns of the images, resource after resource
+
+a text column is stored as its strings joined into one utf-8 blob, with the
+offsets of the strings in characters, so it is decoded with one call and its
+strings are sliced out of the decoded text.
+"""
+import gc
+import io
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from itertools import repeat
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+
+from sagasu import model as m
+
+_FRAME = struct.Struct("<Q")
+# crawlers of the same kind run concurrently and share their snapshot
+_lock = threading.Lock()
+
+
+def _encode_text(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in strings], out=offsets[1:])
+    return np.frombuffer("".join(strings).encode(), dtype=np.uint8), offsets
+
+
+def _decode_text(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    text = blob.tobytes().decode()
+    bounds = offsets.tolist()
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+class Snapshot:
+    """resources of a source, appended batch by batch and loaded as the latest version of every uri"""
+
+    def __init__(
+        self,
+        path: str,
+        resource_type: Type[m.Resource],
+        legacy_dir: Optional[str] = None,
+        max_batches: int = 16,
+        batch_bytes: int = 16 * 2 ** 20,
+    ):
+        """resources crawled before snapshots are read from the tsv files under `legacy_dir`, until
+        the first batch is appended. when more than `max_batches` batches are appended, the snapshot
+        is compacted into batches of about `batch_bytes` of sentences
+        """
+        self.path = path
+        self.resource_type = resource_type
+        self.legacy_dir = legacy_dir
+        self.max_batches = max_batches
+        self.batch_bytes = batch_bytes
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    @staticmethod
+    def _batch(resources: Sequence[m.Resource]) -> bytes:
+        images = [(getattr(r, "image_urls", None) or [], getattr(r, "image_captions", None) or []) for r in resources]
+        columns = {}
+        columns["uri_blob"], columns["uri_offsets"] = _encode_text([r.uri for r in resources])
+        columns["sentence_blob"], columns["sentence_offsets"] = _encode_text([r.sentence for r in resources])
+        columns["media_count"] = np.array([len(urls) for urls, _ in images], dtype=np.int32)
+        columns["media_url_blob"], columns["media_url_offsets"] = _encode_text(
+            [url for urls, _ in images for url in urls])
+        # a missing caption is stored as "empty", like an image which is not captioned
+        columns["media_caption_blob"], columns["media_caption_offsets"] = _encode_text(
+            [caption for urls, captions in images for caption in (list(captions) + ["empty"] * len(urls))[:len(urls)]])
+        buffer = io.BytesIO()
+        np.savez(buffer, **columns)
+        return buffer.getvalue()
+
+    def _frames(self) -> Iterator[Tuple[int, int]]:
+        """positions and lengths of the batches, reading their length prefixes only"""
+        if not self.exists():
+            return
+        size = os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            position = 0
+            while position + _FRAME.size <= size:
+                f.seek(position)
+                (length,) = _FRAME.unpack(f.read(_FRAME.size))
+                position += _FRAME.size
+                if position + length > size:
+                    # the last batch of an interrupted crawl
+                    return
+                yield position, length
+                position += length
+
+    def _read(self, position: int, length: int):
+        with open(self.path, "rb") as f:
+            f.seek(position)
+            return np.load(io.BytesIO(f.read(length)), allow_pickle=False)
+
+    def _legacy(self) -> List[m.Resource]:
+        if self.legacy_dir is None or not os.path.isdir(f"{self.legacy_dir}/uri-sentence"):
+            return []
+        return load_tsv(self.legacy_dir, self.resource_type)
+
+    def append(self, resources: Sequence[m.Resource]):
+        with _lock:
+            if not self.exists():
+                # the resources of the tsv files become the first batch
+                resources = self.load(resources)
+            if not resources:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            frames = list(self._frames())
+            batch = self._batch(resources)
+            with open(self.path, "ab") as f:
+                # drop the incomplete batch of an interrupted crawl, if any
+                f.truncate(size := sum(_FRAME.size + length for _, length in frames))
+                f.write(_FRAME.pack(len(batch)) + batch)
+            # batches written by compaction are full, only appended batches count
+            if len(frames) + 1 > self.max_batches + size // self.batch_bytes:
+                self._compact()
+
+    def _compact(self):
+        """rewrite the snapshot as batches of the latest resources, each about `batch_bytes` large"""
+        with open(tmp := f"{self.path}.tmp", "wb") as f:
+            chunk, size = [], 0
+            for resource in self.stream():
+                chunk.append(resource)
+                if (size := size + len(resource.sentence)) >= self.batch_bytes:
+                    f.write(_FRAME.pack(len(batch := self._batch(chunk))) + batch)
+                    chunk, size = [], 0
+            if chunk:
+                f.write(_FRAME.pack(len(batch := self._batch(chunk))) + batch)
+        os.replace(tmp, self.path)
+
+    def stream(self) -> Iterator[m.Resource]:
+        """yield the latest version of every resource, one batch in memory at a time.
+
+        the uri columns are read first to find where the latest version of every uri is,
+        then every batch yields its resources which are not replaced by a later batch.
+        """
+        if not self.exists():
+            yield from self._legacy()
+            return
+        frames = list(self._frames())
+        latest: Dict[str, Tuple[int, int]] = {}
+        for n, frame in enumerate(frames):
+            with self._read(*frame) as batch:
+                uris = _decode_text(batch["uri_blob"], batch["uri_offsets"])
+            # a later position of the same uri overwrites the earlier one
+            latest.update(zip(uris, zip(repeat(n), range(len(uris)))))
+
+        for n, frame in enumerate(frames):
+            with self._read(*frame) as batch:
+                uris = _decode_text(batch["uri_blob"], batch["uri_offsets"])
+                sentences = _decode_text(batch["sentence_blob"], batch["sentence_offsets"])
+                urls = _decode_text(batch["media_url_blob"], batch["media_url_offsets"])
+                captions = _decode_text(batch["media_caption_blob"], batch["media_caption_offsets"])
+                media_offsets = np.zeros(len(uris) + 1, dtype=np.int64)
+                np.cumsum(batch["media_count"], out=media_offsets[1:])
+            media_offsets = media_offsets.tolist()
+            with _gc_paused():
+                resources = [
+                    self.resource_type(
+                        uri=uri,
+                        sentence=sentences[idx],
+                        image_urls=urls[media_offsets[idx]: media_offsets[idx + 1]],
+                        image_captions=captions[media_offsets[idx]: media_offsets[idx + 1]],
+                    )
+                    for idx, uri in enumerate(uris)
+                    if latest[uri] == (n, idx)
+                ]
+            yield from resources
+
+    def load(self, newer: Sequence[m.Resource] = ()) -> List[m.Resource]:
+        """the latest version of every resource, `newer` resources replace those of the snapshot"""
+        return _latest(self.stream(), newer)
+
+
+@contextmanager
+def _gc_paused():
+    """pause the garbage collector, which would otherwise rescan every object created so far
+    many times while hundred thousands of resources are created"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _latest(resources: Iterable[m.Resource], newer: Sequence[m.Resource]) -> List[m.Resource]:
+    latest: Dict[str, m.Resource] = {resource.uri: resource for resource in resources}
+    latest.update((resource.uri, resource) for resource in newer)
+    return list(latest.values())
+
+
+def load_tsv(directory: str, resource_type: Type[m.Resource]) -> List[m.Resource]:
+    """resources of the `uri-sentence` and `uri-media` tsv files written by the crawlers before snapshots"""
+    import pandas as pd
+
+    def read(kind: str) -> pd.DataFrame:
+        files = sorted(p for p in Path(f"{directory}/{kind}").iterdir() if p.is_file())
+        return pd.concat([pd.read_csv(p, sep="\t", index_col=0, dtype=str, keep_default_na=False) for p in files])
+
+    # files are named by the hour of the crawl, so the last row of a uri is its latest version
+    sentences = read("uri-sentence").drop_duplicates("uri", keep="last")
+    media = read("uri-media").drop_duplicates("uri", keep="last")
+    df = sentences.merge(media, on="uri", how="left").fillna("empty")
+    urls = df[[f"media_url{n}" for n in range(1, 5)]].to_numpy().tolist()
+    captions = df[[f"media_caption{n}" for n in range(1, 5)]].to_numpy().tolist()
+    return [
+        resource_type(uri=uri, sentence=sentence, image_urls=urls[idx], image_captions=captions[idx])
+        for idx, (uri, sentence) in enumerate(zip(df["uri"].tolist(), df["sentence"].tolist()))
+    ]
@@ -0,0 +1,368 @@
+"""binary index format, opened with mmap.
+
+layout (little endian)::
+
+    header   magic(8s) version(I) section count(I)
+    sections name(8s) offset(Q) length(Q), for each section
+    TERMS    term offset(Q) term length(I) postings offset(Q) document count(I) frequencies offset(Q),
+             sorted by term
+    TERMBLOB utf-8 terms
+    POSTINGS document ids of each term, compressed as gaps in bit packed blocks (see `sagasu.codec`)
+    FREQS    term frequencies of each term, compressed in bit packed blocks
+    BOUNDS   largest term frequency(I) and shortest document length(I) of each term, as in TERMS
+    DOCS     offsets(Q) of each document in DOCBLOB, followed by the end offset
+    DOCBLOB  json of each resource
+    HASHES   sha1 of the json of each resource, to find changed documents
+    LENGTHS  length in tokens of each document as uint32
+    STATS    document count(Q) sum of lengths(Q)
+    URIS     uri of each document, stored the same way as terms with the URIBLOB and
+             URIPOSTS sections, to find the documents of a uri without decoding them
+
+optionally, the character trigrams of the documents (see `sagasu.trigram`) are
+stored the same way as terms, in TRIGRAMS, TRIBLOB and TRIPOSTS sections,
+without frequencies nor bounds.
+
+only the header and the section table are read on open, the term dictionary is
+binary searched in place and only the postings and documents a query touches
+are decoded. indexes of version 1, whose TERMS have no frequencies offset and
+whose postings and frequencies are uint32 at the same positions, are still read.
+"""
+import copy
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sagasu.codec import decode_frequencies, decode_postings, encode_frequencies, encode_postings
+from sagasu.model import IndexedResource, Resource, SpooledDocuments, content_hash, encode_resource, resource_from_dict
+
+MAGIC = b"SAGASUIX"
+VERSION = 2
+
+_HEADER = struct.Struct("<8sII")
+_SECTION = struct.Struct("<8sQQ")
+_TERM = struct.Struct("<QIQIQ")
+_TERM_V1 = struct.Struct("<QIQI")
+_OFFSET = struct.Struct("<Q")
+_STATS = struct.Struct("<QQ")
+_BOUNDS = struct.Struct("<II")
+_HASH_SIZE = hashlib.sha1().digest_size
+# decoded posting lists kept by an index, a query decodes those of its terms a few times
+_DECODED_LISTS = 256
+
+# names of the term table, term blob, postings, and optionally frequencies and bounds sections
+# of a term dictionary
+TERM_SECTIONS = (b"TERMS", b"TERMBLOB", b"POSTINGS", b"FREQS", b"BOUNDS")
+TRIGRAM_SECTIONS = (b"TRIGRAMS", b"TRIBLOB", b"TRIPOSTS")
+URI_SECTIONS = (b"URIS", b"URIBLOB", b"URIPOSTS")
+
+
+class IndexFormatError(Exception):
+    pass
+
+
+def _uint32(values: Sequence[int]) -> bytes:
+    a = array("I", values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _offsets(values: array) -> bytes:
+    a = array("Q", values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+class _Spooled:
+    """encoded documents of a spool as a section, copied to the index file without reading them into memory"""
+
+    def __init__(self, documents: SpooledDocuments):
+        self.documents = documents
+
+    def __len__(self) -> int:
+        return self.documents.nbytes
+
+    def copy_to(self, f):
+        self.documents.copy_to(f)
+
+
+def _term_sections(indexed_resource: IndexedResource, names: Tuple[bytes, ...]) -> List[Tuple[bytes, bytes]]:
+    term_table = bytearray()
+    term_blob = bytearray()
+    postings = bytearray()
+    term_frequencies = bytearray()
+    bounds = bytearray()
+    for term in sorted(indexed_resource.indexed):
+        encoded = term.encode()
+        doc_ids = indexed_resource.indexed[term]
+        term_table += _TERM.pack(len(term_blob), len(encoded), len(postings), len(doc_ids), len(term_frequencies))
+        term_blob += encoded
+        postings += encode_postings(doc_ids)
+        if len(names) > 3:
+            term_frequencies += encode_frequencies(indexed_resource.frequencies[term])
+            bounds += _BOUNDS.pack(*indexed_resource.term_bounds(term))
+    sections = [(names[0], term_table), (names[1], term_blob), (names[2], postings)]
+    return sections + list(zip(names[3:], [term_frequencies, bounds]))
+
+
+def _uri_sections(documents: Iterable[Resource]) -> List[Tuple[bytes, bytes]]:
+    uri_table = bytearray()
+    uri_blob = bytearray()
+    postings = bytearray()
+    uris = sorted((document.uri.encode(), doc_id) for doc_id, document in enumerate(documents))
+    for encoded, group in groupby(uris, key=itemgetter(0)):
+        doc_ids = array("I", (doc_id for _, doc_id in group))
+        uri_table += _TERM.pack(len(uri_blob), len(encoded), len(postings), len(doc_ids), 0)
+        uri_blob += encoded
+        postings += encode_postings(doc_ids)
+    return list(zip(URI_SECTIONS, [uri_table, uri_blob, postings]))
+
+
+def write_index(indexed_resource: IndexedResource, path: str, trigrams: Optional[IndexedResource] = None):
+    """write the index, and the trigram index of its documents if given"""
+    documents = indexed_resource.documents
+    doc_table = bytearray()
+    doc_blob = bytearray()
+    hashes = bytearray()
+    if isinstance(documents, SpooledDocuments):
+        # spooled documents are encoded already, and copied from their file to the index file
+        for doc_id in range(len(documents)):
+            hashes += hashlib.sha1(documents.encoded(doc_id)).digest()
+        doc_table = _offsets(documents.offsets)
+        doc_blob = _Spooled(documents)
+    else:
+        for document in documents:
+            doc_table += _OFFSET.pack(len(doc_blob))
+            encoded = encode_resource(document)
+            doc_blob += encoded
+            hashes += hashlib.sha1(encoded).digest()
+        doc_table += _OFFSET.pack(len(doc_blob))
+
+    sections = _term_sections(indexed_resource, TERM_SECTIONS) + [
+        (b"DOCS", doc_table),
+        (b"DOCBLOB", doc_blob),
+        (b"HASHES", hashes),
+        (b"LENGTHS", _uint32(indexed_resource.lengths)),
+        (b"STATS", _STATS.pack(len(indexed_resource.documents), sum(indexed_resource.lengths))),
+    ] + _uri_sections(documents)
+    if trigrams is not None:
+        # a trigram occurs once per document as far as search is concerned
+        sections += _term_sections(trigrams, TRIGRAM_SECTIONS)
+
+    # write aside and rename, processes which still map the old file keep reading it
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        offset = _HEADER.size + _SECTION.size * len(sections)
+        table = bytearray()
+        for name, body in sections:
+            offset += -offset % 8
+            table += _SECTION.pack(name, offset, len(body))
+            offset += len(body)
+        f.write(_HEADER.pack(MAGIC, VERSION, len(sections)))
+        f.write(table)
+        for name, body in sections:
+            f.write(b"\0" * (-f.tell() % 8))
+            if isinstance(body, _Spooled):
+                body.copy_to(f)
+            else:
+                f.write(body)
+    os.replace(tmp_path, path)
+
+
+class _Postings(Mapping):
+    """read only `indexed` view, for compatibility with IndexedResource"""
+
+    def __init__(self, index: "MappedIndex"):
+        self._index = index
+
+    def __getitem__(self, term: str) -> Sequence[int]:
+        if (i := self._index._find(term)) < 0:
+            raise KeyError(term)
+        return self._index._postings_at(i)
+
+    def __contains__(self, term) -> bool:
+        return self._index._find(term) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        return self._index.terms()
+
+    def __len__(self) -> int:
+        return self._index.term_count
+
+
+class MappedIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        magic, version, section_count = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise IndexFormatError(f"{path} is not a sagasu index")
+        if not 1 <= version <= VERSION:
+            raise IndexFormatError(f"{path} has index format version {version}, expected {VERSION} at most")
+        self.version = version
+        self._term = _TERM if version >= 2 else _TERM_V1
+
+        self._sections: Dict[bytes, memoryview] = {}
+        for n in range(section_count):
+            name, offset, length = _SECTION.unpack_from(self._buffer, _HEADER.size + _SECTION.size * n)
+            self._sections[name.rstrip(b"\0")] = self._buffer[offset: offset + length]
+
+        self._bind_terms(TERM_SECTIONS)
+        self._doc_table = self._sections[b"DOCS"]
+        self._doc_blob = self._sections[b"DOCBLOB"]
+        # indexes written before ranking was supported have no frequencies nor lengths
+        self._lengths = self._uint32_view(self._sections[b"LENGTHS"]) if b"LENGTHS" in self._sections else None
+        self._stats = _STATS.unpack(self._sections[b"STATS"]) if b"STATS" in self._sections else None
+        self._hashes = self._sections.get(b"HASHES")
+
+    def _bind_terms(self, names: Tuple[bytes, ...]):
+        if not self.has_terms(names):
+            raise IndexFormatError(f"{self.path} has no {names[0].decode()} section")
+        self._term_table = self._sections[names[0]]
+        self._term_blob = self._sections[names[1]]
+        self._postings = self._sections[names[2]]
+        self._frequencies = self._sections.get(names[3]) if len(names) > 3 else None
+        self._bounds = self._sections.get(names[4]) if len(names) > 4 else None
+        self.term_count = len(self._term_table) // self._term.size
+        self.indexed = _Postings(self)
+        # a view has its own cache, since term ids differ from one term dictionary to another
+        self._decoded_postings = lru_cache(maxsize=_DECODED_LISTS)(self._decode_postings)
+
+    def has_terms(self, names: Tuple[bytes, ...]) -> bool:
+        return names[0] in self._sections
+
+    def view(self, names: Tuple[bytes, ...]) -> "MappedIndex":
+        """the same mapped file with another term dictionary, such as TRIGRAM_SECTIONS.
+
+        the view shares the mapping, so it always matches the documents of this index,
+        even when the file has been replaced since.
+        """
+        view = copy.copy(self)
+        view._bind_terms(names)
+        return view
+
+    def __len__(self) -> int:
+        return len(self._doc_table) // _OFFSET.size - 1
+
+    def _term_at(self, i: int) -> bytes:
+        offset, length = self._term.unpack_from(self._term_table, self._term.size * i)[:2]
+        return bytes(self._term_blob[offset: offset + length])
+
+    def _find(self, term: str) -> int:
+        key = term.encode()
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.term_count and self._term_at(lo) == key:
+            return lo
+        return -1
+
+    @staticmethod
+    def _uint32_view(view: memoryview) -> Sequence[int]:
+        if sys.byteorder == "big":
+            a = array("I", view.tobytes())
+            a.byteswap()
+            return a
+        return view.cast("I")
+
+    def _decode_postings(self, i: int) -> Sequence[int]:
+        _, _, offset, count, _ = _TERM.unpack_from(self._term_table, _TERM.size * i)
+        return decode_postings(self._postings[offset:], count)
+
+    def _postings_at(self, i: int) -> Sequence[int]:
+        if self.version >= 2:
+            return self._decoded_postings(i)
+        _, _, offset, length = _TERM_V1.unpack_from(self._term_table, _TERM_V1.size * i)
+        return self._uint32_view(self._postings[offset: offset + length * 4])
+
+    def _frequencies_at(self, i: int) -> Sequence[int]:
+        if self.version >= 2:
+            _, _, _, count, offset = _TERM.unpack_from(self._term_table, _TERM.size * i)
+            if self._frequencies is None:
+                return array("I", [1] * count)
+            return decode_frequencies(self._frequencies[offset:], count)
+        _, _, offset, length = _TERM_V1.unpack_from(self._term_table, _TERM_V1.size * i)
+        if self._frequencies is None:
+            return array("I", [1] * length)
+        return self._uint32_view(self._frequencies[offset: offset + length * 4])
+
+    def terms(self) -> Iterator[str]:
+        return (self._term_at(i).decode() for i in range(self.term_count))
+
+    def postings(self, term: str) -> Sequence[int]:
+        if (i := self._find(term)) < 0:
+            return array("I")
+        return self._postings_at(i)
+
+    def term_frequencies(self, term: str) -> Sequence[int]:
+        if (i := self._find(term)) < 0:
+            return array("I")
+        return self._frequencies_at(i)
+
+    def term_bounds(self, term: str) -> Optional[Tuple[int, int]]:
+        # indexes written before pruning was supported have no bounds
+        if self._bounds is None or (i := self._find(term)) < 0:
+            return None
+        return _BOUNDS.unpack_from(self._bounds, _BOUNDS.size * i)
+
+    def document_length(self, doc_id: int) -> int:
+        return self._lengths[doc_id] if self._lengths is not None else 1
+
+    def document_lengths(self) -> Sequence[int]:
+        return self._lengths if self._lengths is not None else array("I", [1]) * len(self)
+
+    def average_document_length(self) -> float:
+        if self._stats is None:
+            return 1.0
+        count, total = self._stats
+        return total / count if count else 0.0
+
+    def total_length(self) -> int:
+        """sum of the lengths of every document"""
+        return self._stats[1] if self._stats is not None else len(self)
+
+    def document_hash(self, doc_id: int) -> bytes:
+        if self._hashes is None:
+            return content_hash(self.document(doc_id))
+        return bytes(self._hashes[_HASH_SIZE * doc_id: _HASH_SIZE * (doc_id + 1)])
+
+    def iter_postings(self) -> Iterator[Tuple[str, Sequence[int], Sequence[int]]]:
+        # every list is decoded once, it does not take the place of the lists of queries in the cache
+        postings_at = self._decode_postings if self.version >= 2 else self._postings_at
+        for i in range(self.term_count):
+            yield self._term_at(i).decode(), postings_at(i), self._frequencies_at(i)
+
+    def document(self, doc_id: int) -> Resource:
+        start, end = struct.unpack_from("<QQ", self._doc_table, _OFFSET.size * doc_id)
+        return resource_from_dict(json.loads(bytes(self._doc_blob[start:end])))
+
+    @property
+    def documents(self) -> List[Resource]:
+        return [self.document(doc_id) for doc_id in range(len(self))]
+
+    def search(self, term: str) -> List[Resource]:
+        return [self.document(doc_id) for doc_id in self.postings(term)]
+
+
+def latest_index(directory: str) -> Optional[Path]:
+    """return the most recently written index file under the directory, or None"""
+    paths = [p for p in Path(directory).iterdir() if p.suffix == ".idx"] if Path(directory).exists() else []
+    return max(paths, key=lambda p: p.stat().st_ctime, default=None)
@@ -0,0 +1,120 @@
+"""character trigram index, for substring and regular expression search.
+
+terms of the main index follow token boundaries, so a substring across tokens
+does not match any of them. every three characters of every sentence are
+indexed instead, a substring or a pattern narrows the candidates to the
+documents having all of its trigrams, and only those documents are checked.
+
+the trigrams are stored in the index file of the documents (see `sagasu.storage`),
+an index written before they were is indexed again in memory when opened.
+"""
+import re
+from typing import Iterable, Iterator, List, Optional, Sequence, Set
+
+from sagasu.model import IndexedResource, Resource
+from sagasu.postings import intersect
+from sagasu.storage import TRIGRAM_SECTIONS
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # python < 3.11
+    import sre_parse
+
+N = 3
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[idx: idx + N] for idx in range(len(text) - N + 1)}
+
+
+def build(documents: Iterable[Resource]) -> IndexedResource:
+    indexed = IndexedResource(indexed={})
+    for doc_id, document in enumerate(documents):
+        indexed.add_postings(doc_id, trigrams(document.sentence))
+    return indexed
+
+
+def _literals(parsed) -> Iterator[str]:
+    """runs of characters which every match of the parsed pattern contains"""
+    run = ""
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run += chr(av)
+            continue
+        if op is sre_parse.SUBPATTERN:
+            # a group matches its own content, runs inside it are required too
+            yield run
+            run = ""
+            yield from _literals(av[-1])
+            continue
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            # the repeated item is matched at least once
+            yield run
+            run = ""
+            yield from _literals(av[2])
+            continue
+        if op is sre_parse.AT:
+            # anchors match no character, the run goes on
+            continue
+        yield run
+        run = ""
+    yield run
+
+
+def _scoped_flags(parsed) -> Iterator[int]:
+    """flags turned on for a part of the parsed pattern only, as in `(?i:...)`"""
+    for op, av in parsed:
+        if op is sre_parse.SUBPATTERN:
+            yield av[1]
+        # groups, branches, repeats and lookarounds hold nested patterns
+        for value in av if isinstance(av, (tuple, list)) else ():
+            for nested in value if isinstance(value, list) else [value]:
+                if isinstance(nested, sre_parse.SubPattern):
+                    yield from _scoped_flags(nested)
+
+
+def required_trigrams(pattern: str) -> Optional[Set[str]]:
+    """trigrams every match of the pattern contains, or None when nothing narrows the search"""
+    parsed = sre_parse.parse(pattern)
+    # trigrams are case sensitive, a case insensitive match may have none of them
+    if parsed.state.flags & re.IGNORECASE or any(flags & re.IGNORECASE for flags in _scoped_flags(parsed)):
+        return None
+    required = set().union(*(trigrams(run) for run in _literals(parsed)))
+    return required or None
+
+
+class TrigramSearcher:
+    """substring and regular expression search over the documents of an index"""
+
+    def __init__(self, index, trigram_index):
+        """`trigram_index` is the trigram index of the documents of `index`, mapped or in memory"""
+        self.index = index
+        self.trigram_index = trigram_index
+
+    @classmethod
+    def open(cls, index) -> "TrigramSearcher":
+        """use the trigrams stored with the index, or build them from the documents"""
+        # mapped and segmented indexes may have them
+        if hasattr(index, "has_terms") and index.has_terms(TRIGRAM_SECTIONS):
+            return cls(index, index.view(TRIGRAM_SECTIONS))
+        return cls(index, build(index.documents))
+
+    def candidates(self, required: Optional[Set[str]]) -> Sequence[int]:
+        if required is None:
+            return range(len(self.index))
+        return intersect([self.trigram_index.postings(trigram) for trigram in required])
+
+    def substring(self, text: str) -> List[int]:
+        """ids of the documents containing the text"""
+        required = trigrams(text) or None
+        return [
+            doc_id for doc_id in self.candidates(required) if text in self.index.document(doc_id).sentence
+        ]
+
+    def regex(self, pattern: str) -> List[int]:
+        """ids of the documents matching the regular expression somewhere"""
+        compiled = re.compile(pattern)
+        return [
+            doc_id for doc_id in self.candidates(required_trigrams(pattern))
+            if compiled.search(self.index.document(doc_id).sentence)
+        ]
@@ -1,28 +1,75 @@
+import math
+import threading
+from functools import lru_cache
+from typing import List, Tuple
+
 import streamlit as st
 
 from sagasu.config import ConfigUtil
 from sagasu.engine import SearchEngine
 
-config = ConfigUtil().load()
-search_engine = SearchEngine(config)
+PER_PAGE = 10
+SNIPPET_LENGTH = 200
+
+
+class CachedSearch:
+  """search shared by every session, remembering the latest pages of results.
+
+  a page keeps snippets instead of resources, so the cache stays small. the
+  engine switches to a newer index once one is written, without a restart.
+  """
+
+  def __init__(self, engine: SearchEngine, size: int = 256):
+    self.engine = engine
+    self.page = lru_cache(maxsize=size)(self._page)
+    # sessions run in threads, a newer index is loaded by one of them only
+    self.reload_lock = threading.Lock()
+
+  def _page(self, version, query: str, page: int) -> Tuple[int, List[Tuple[str, str]]]:
+    # the index version is a part of the key, results of a previous index are never returned
+    total, ranked = self.engine.query_page(query, (page - 1) * PER_PAGE, PER_PAGE)
+    return total, [(resource.uri, resource.sentence[:SNIPPET_LENGTH]) for resource, _ in ranked]
+
+  def __call__(self, query: str, page: int) -> Tuple[int, List[Tuple[str, str]]]:
+    # reloading checks the manifest only, the index is loaded again when it has changed
+    with self.reload_lock:
+      self.engine.reload()
+      # read with the reload, another session may reload the engine as soon as the lock is released
+      version = self.engine.index_version
+    return self.page(version, query, page)
+
+
+# streamlit runs this script again on every input, the engine is loaded once for every session
+@st.cache(allow_output_mutation=True)
+def cached_search() -> CachedSearch:
+  return CachedSearch(SearchEngine(ConfigUtil().load()))
 
 
 def main():
+  search = cached_search()
   st.title("sagasu")
-  word = st.text_input('')
-  resources = search_engine.word_search(word)
-  if not resources and word:
+  if (outdated := search.engine.segments.outdated()) is not None:
+    st.write(f"{outdated} は古い sagasu のインデックスです。`sagasu indexing` でインデックスを作り直してください")
+    return
+  word = st.text_input('').strip()
+  if not word:
+    return
+  total, _ = search(word, 1)
+  if not total:
     st.write(f"その単語は登録されていません")
-  elif word and resources:
-    resources = set(resources)
-    md = ''.join(f"""
-{resource.sentence[:200]}
+    return
+
+  pages = math.ceil(total / PER_PAGE)
+  page = st.number_input(f"{total} 件 ({pages} ページ)", min_value=1, max_value=pages, value=1, step=1)
+  _, results = search(word, int(page))
+  md = ''.join(f"""
+{snippet}
 
-{resource.uri}
+{uri}
 
 ---
-""" for resource in resources)
-    st.markdown(md)
+""" for uri, snippet in results)
+  st.markdown(md)
   return
 
 
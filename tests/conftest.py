@@ -0,0 +1,16 @@
+import pytest
+
+from sagasu.model import IndexedResource
+
+
+@pytest.fixture
+def build_index():
+    """a function indexing resources by the words of their sentences, without GiNZA"""
+    def build(resources):
+        indexed_resource = IndexedResource(indexed={})
+        for resource in resources:
+            tokens = resource.sentence.split()
+            indexed_resource.add_postings(indexed_resource.add(resource, len(tokens)), tokens)
+        return indexed_resource
+
+    return build
@@ -0,0 +1,79 @@
+import asyncio
+import json
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from sagasu.api import SearchServer
+from sagasu.config import ConfigModel, SourceModel
+from sagasu.engine import SearchEngine
+
+
+def _get(url, method="GET"):
+    try:
+        with urlopen(Request(url, method=method)) as response:
+            return response.status, response.headers, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, e.headers, json.loads(e.read())
+
+
+def test_search_server():
+    search_engine = SearchEngine(ConfigModel([SourceModel(source_type="dummy", target="dummy")]))
+    search_engine.indexing(dump=False)
+
+    async def run():
+        server = SearchServer(search_engine, port=0, poll=0)
+        base = f"http://127.0.0.1:{(await server.start()).sockets[0].getsockname()[1]}"
+        loop = asyncio.get_event_loop()
+        responses = [
+            await loop.run_in_executor(None, _get, f"{base}{path}")
+            for path in [
+                "/search?q=dummy&per_page=1", "/search?q=dummy&page=2&per_page=1", "/search", "/nothing",
+                "/grep?q=s%20a%20d", "/grep?q=(&regex=1",
+            ]
+        ]
+        responses.append(await loop.run_in_executor(None, _get, f"{base}/stats"))
+        server.server.close()
+        return responses
+
+    responses = asyncio.new_event_loop().run_until_complete(run())
+    first, second, missing_query, not_found, grep, bad_pattern, stats = responses
+
+    assert first[0] == 200 and first[2]["total"] == 2
+    assert len(first[2]["results"]) == 1
+    assert first[1]["X-Response-Time"].endswith("ms")
+    assert {first[2]["results"][0]["uri"], second[2]["results"][0]["uri"]} == {"dummy", "dummy2"}
+    assert missing_query[0] == 400
+    assert not_found[0] == 404
+    assert grep[2]["total"] == 1 and grep[2]["results"][0]["uri"] == "dummy2"
+    assert bad_pattern[0] == 400
+    assert stats[2]["requests"] == 6
+
+
+def test_search_server_errors(monkeypatch):
+    search_engine = SearchEngine(ConfigModel([SourceModel(source_type="dummy", target="dummy")]))
+    search_engine.indexing(dump=False)
+
+    def fail(*args):
+        raise ValueError("broken index")
+
+    monkeypatch.setattr(search_engine, "query_page", fail)
+
+    async def run():
+        server = SearchServer(search_engine, port=0, poll=0)
+        port = (await server.start()).sockets[0].getsockname()[1]
+        loop = asyncio.get_event_loop()
+        failed = await loop.run_in_executor(None, _get, f"http://127.0.0.1:{port}/search?q=dummy")
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /stats HTTP/1.1\r\nContent-Length: many\r\n\r\n")
+        bad_length = await reader.read()
+        writer.close()
+        # the index was removed, there is no version to tell
+        monkeypatch.setattr(search_engine, "index_version", ("removed", 0))
+        reloaded = await server.reload()
+        server.server.close()
+        return failed, bad_length, reloaded
+
+    failed, bad_length, reloaded = asyncio.new_event_loop().run_until_complete(run())
+    assert failed[0] == 500
+    assert bad_length.startswith(b"HTTP/1.1 400 ")
+    assert reloaded and search_engine.index_version is None
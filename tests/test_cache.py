@@ -0,0 +1,19 @@
+import time
+
+from sagasu.cache import DiskCache
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    cache.put("a", b"a" * 100)
+    time.sleep(0.01)
+    cache.put("b", b"b" * 100)
+    time.sleep(0.01)
+    assert cache.get("a") == b"a" * 100
+    time.sleep(0.01)
+    cache.put("c", b"c" * 100)
+
+    assert cache.get("a") == b"a" * 100
+    assert cache.get("b") is None
+    assert cache.get("c") == b"c" * 100
+    assert DiskCache(str(tmp_path), max_bytes=250).size == 200
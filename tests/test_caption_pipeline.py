@@ -0,0 +1,82 @@
+import threading
+from types import SimpleNamespace
+
+from sagasu.caption_pipeline import CaptionPipeline
+from sagasu.config import SourceModel
+from sagasu.crawler import Crawler
+from sagasu.incremental import Changes
+from sagasu.model import IndexedResource, TwitterResource
+from sagasu.storage import MappedIndex, write_index
+
+
+class EchoCaptioner:
+    """captions an image with its url, remembering the size of every batch"""
+    batch_size = 4
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def prepare(self, media_url):
+        if media_url.endswith("broken"):
+            raise ValueError("not an image")
+        if media_url.endswith("cached"):
+            return SimpleNamespace(caption="cached caption")
+        return SimpleNamespace(caption=None, image=media_url)
+
+    def caption_prepared(self, batch):
+        with self.lock:
+            self.batches.append(len(batch))
+        return [f"caption of {prepared.image}" for prepared in batch]
+
+
+def test_caption_pipeline():
+    captioner = EchoCaptioner()
+    pipeline = CaptionPipeline(captioner, downloaders=3, queue_size=2)
+    resources = [
+        TwitterResource(uri=str(n), sentence="", image_urls=[f"img{n}-{i}" for i in range(n % 3)], image_captions=[])
+        for n in range(10)
+    ]
+    resources.append(TwitterResource(uri="c", sentence="", image_urls=["x-cached", "y-broken"], image_captions=[]))
+    ready = []
+    for resource in resources:
+        pipeline.submit(resource)
+        ready += pipeline.ready()
+    pipeline.close()
+    ready += pipeline.ready()
+
+    # resources are ready in the order they were submitted, once their captions are attached
+    assert ready == resources
+
+    assert resources[2].image_captions == ["caption of img2-0", "caption of img2-1"]
+    assert resources[3].image_captions == []
+    assert resources[-1].image_captions == ["cached caption", "empty"]
+    assert sum(captioner.batches) == sum(n % 3 for n in range(10))
+    assert max(captioner.batches) <= captioner.batch_size
+
+
+class CaptionedCrawler(Crawler):
+    def _collect(self):
+        images = [[f"img{n}-{i}" for i in range(n % 3)] for n in range(10)]
+        return self._captioned(
+            TwitterResource(uri=str(n), sentence=f"tweet {n}", image_urls=urls, image_captions=[])
+            for n, urls in enumerate(images)
+        )
+
+    def _dump(self, resources):
+        pass
+
+
+def test_captioned_resources_are_unchanged_on_the_next_crawl(tmp_path, monkeypatch):
+    monkeypatch.setenv("SAGASU_CAPTION", "true")
+    monkeypatch.setattr("sagasu.crawler.get_captioner", EchoCaptioner, raising=False)
+    crawler = CaptionedCrawler(SourceModel(source_type="twitter", target="me"))
+    indexed_resource = IndexedResource(indexed={})
+    for resource in crawler.stream():
+        indexed_resource.add(resource, 1)
+    write_index(indexed_resource, path := str(tmp_path / "index.idx"))
+    index = MappedIndex(path)
+    assert index.document(2).image_captions == ["caption of img2-0", "caption of img2-1"]
+
+    changes = Changes(index)
+    assert list(changes.stream(crawler.stream())) == []
@@ -0,0 +1,24 @@
+import random
+from array import array
+
+from sagasu.codec import (
+    BLOCK_SIZE, decode, decode_frequencies, decode_postings, encode, encode_frequencies, encode_postings
+)
+
+
+def test_round_trip():
+    rng = random.Random(0)
+    for count in [0, 1, 2, 31, 32, 33, BLOCK_SIZE, BLOCK_SIZE + 1, BLOCK_SIZE * 10 + 7]:
+        doc_ids = array("I", sorted(rng.sample(range(1 << 20), count)))
+        frequencies = array("I", (rng.choice([1, 1, 1, 2, 300]) for _ in range(count)))
+        assert decode_postings(encode_postings(doc_ids), count) == doc_ids
+        assert decode_frequencies(encode_frequencies(frequencies), count) == frequencies
+        assert decode(encode(frequencies), count) == frequencies
+    assert decode_postings(encode_postings([0, (1 << 32) - 1]), 2) == array("I", [0, (1 << 32) - 1])
+
+
+def test_dense_postings_are_small():
+    doc_ids = array("I", range(0, 100000, 2))
+    assert len(encode_postings(doc_ids)) < len(doc_ids) // 2
+    # frequencies of one take no bits at all but the width of every block
+    assert len(encode_frequencies([1] * len(doc_ids))) == -(-len(doc_ids) // BLOCK_SIZE)
@@ -0,0 +1,25 @@
+import pytest
+
+from sagasu.config import ConfigError, ConfigUtil
+
+
+def _load(tmp_path, yml):
+    (path := tmp_path / "config.yml").write_text(yml)
+    config_util = ConfigUtil()
+    config_util.path = str(path)
+    return config_util.load()
+
+
+def test_load(tmp_path):
+    config = _load(tmp_path, "sources:\n  - source_type: scrapbox\n    target: p\n    rate: 4\nworkers: 2\n")
+    assert config.sources[0].target == "p" and config.sources[0].rate == 4
+    assert config.workers == 2
+
+
+def test_unknown_and_missing_keys(tmp_path):
+    with pytest.raises(ConfigError, match="unknown key concurency in source 2 of config.yml, did you mean concurrency"):
+        _load(tmp_path, "sources:\n  - {source_type: dummy, target: d}\n  - {source_type: dummy, target: d, concurency: 2}\n")
+    with pytest.raises(ConfigError, match="expected one of source_type, target"):
+        _load(tmp_path, "sources:\n  - {source_type: dummy, target: d, xyz: 1}\n")
+    with pytest.raises(ConfigError, match="source 1 of config.yml has no target"):
+        _load(tmp_path, "sources:\n  - {source_type: dummy}\n")
@@ -0,0 +1,137 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from sagasu.config import ConfigModel, SourceModel
+from sagasu.crawler import ScrapboxCrawler
+from sagasu.engine import SearchEngine
+from sagasu.fetcher import Fetcher
+
+PAGES = [{"id": str(n), "title": f"page/{n}", "updated": n} for n in range(250)]
+
+
+class ScrapboxHandler(BaseHTTPRequestHandler):
+    """stand-in for the Scrapbox API, answering 429 to the first request of every tenth page"""
+    throttled = set()
+    # titles of the pages whose body has been fetched
+    fetched = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/pages/project":
+            query = parse_qs(url.query)
+            skip, limit = int(query["skip"][0]), int(query["limit"][0])
+            return self._json({"count": len(PAGES), "pages": PAGES[skip: skip + limit]})
+        if url.path == "/unavailable":
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        title = url.path.rsplit("/", 1)[-1]
+        with self.lock:
+            first = title.endswith("0") and title not in self.throttled
+            self.throttled.add(title)
+        if first:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+        self.fetched.append(title)
+        self._json({"lines": [{"text": title}, {"text": "本文"}]})
+
+    def _json(self, body):
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ScrapboxHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_scrapbox_crawler_concurrent_fetch(endpoint):
+    source = SourceModel(source_type="scrapbox", target="project", concurrency=8, rate=1000, endpoint=endpoint)
+    resources = list(ScrapboxCrawler(source)._collect())
+    assert len(resources) == len(PAGES)
+    assert resources[3].uri == "https://scrapbox.io/project/page%2F3"
+    assert resources[3].sentence == "page%2F3 本文"
+
+
+def test_fetcher_raises_once_retries_are_exhausted(endpoint):
+    with pytest.raises(requests.HTTPError):
+        Fetcher(rate=1000, retries=2, backoff=0).get(f"{endpoint}/unavailable")
+
+
+def test_fetcher_caps_delays():
+    fetcher = Fetcher(backoff=1, max_delay=10)
+    response = requests.Response()
+    response.headers["Retry-After"] = "86400"
+    assert fetcher._delay(0, response) == 10
+    response.headers["Retry-After"] = "3"
+    assert fetcher._delay(0, response) == 3
+    assert fetcher._delay(2) == 4
+    assert fetcher._delay(8) == 10
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.setattr("sagasu.crawler.CRAWLER_WORK_DIR", str(tmp_path / "crawler"))
+    monkeypatch.setattr("sagasu.engine.SAGASU_WORKDIR", str(tmp_path))
+    return tmp_path
+
+
+def _crawl(endpoint, dump=True):
+    source = SourceModel(source_type="scrapbox", target="project", concurrency=8, rate=1000, endpoint=endpoint)
+    search_engine = SearchEngine(ConfigModel([source], workers=1))
+    ScrapboxHandler.fetched.clear()
+    search_engine.reduce_indexing_stream(dump=dump)
+    return search_engine
+
+
+def _update(monkeypatch, n):
+    pages = list(PAGES)
+    pages[n] = {**pages[n], "updated": 1000}
+    monkeypatch.setattr(f"{__name__}.PAGES", pages)
+
+
+def test_scrapbox_crawler_fetches_updated_pages_only(endpoint, workdir, monkeypatch):
+    state_path = workdir / "crawler" / "scrapbox" / "state" / "project.json"
+    _crawl(endpoint, dump=False)
+    assert not state_path.exists()
+
+    assert len(_crawl(endpoint).indexed_resource) == len(PAGES)
+    assert len(ScrapboxHandler.fetched) == len(PAGES)
+    assert state_path.exists()
+
+    _update(monkeypatch, 5)
+    assert len(_crawl(endpoint).indexed_resource) == len(PAGES)
+    assert ScrapboxHandler.fetched == ["page%2F5"]
+
+    # the state is not saved when the index is not updated, the page is fetched again next time
+    _update(monkeypatch, 6)
+
+    def fail(*args):
+        raise RuntimeError("indexing failed")
+
+    with monkeypatch.context() as m:
+        m.setattr(SearchEngine, "_apply", fail)
+        with pytest.raises(RuntimeError):
+            _crawl(endpoint)
+    _crawl(endpoint)
+    assert ScrapboxHandler.fetched == ["page%2F6"]
@@ -0,0 +1,45 @@
+import random
+
+from sagasu.dictionary import BLOCK_SIZE, TermDictionary
+
+
+def _levenshtein(a, b):
+    row = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        previous, row[0] = row[0], i
+        for j, y in enumerate(b, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (x != y))
+    return row[-1]
+
+
+def test_prefix_and_contains():
+    terms = ["料理", "料理人", "散歩", "料", "dummy", "dummy2", "this"]
+    dictionary = TermDictionary.from_terms(terms + ["料理"])
+    assert len(dictionary) == 7
+    assert list(dictionary) == sorted(terms)
+    assert list(dictionary.prefix("料")) == ["料", "料理", "料理人"]
+    assert list(dictionary.prefix("料", limit=2)) == ["料", "料理"]
+    assert list(dictionary.prefix("猫")) == []
+    assert "散歩" in dictionary and "散" not in dictionary
+    assert list(TermDictionary.from_terms([]).prefix("a")) == []
+
+
+def test_many_blocks_match_sorted_list():
+    rng = random.Random(0)
+    terms = sorted({"".join(rng.choice("abcあい") for _ in range(rng.randint(1, 6))) for _ in range(BLOCK_SIZE * 40)})
+    dictionary = TermDictionary.from_sorted(terms)
+    assert list(dictionary) == terms
+    for prefix in ["", "a", "ab", "あい", "cab", "z"]:
+        assert list(dictionary.prefix(prefix)) == [term for term in terms if term.startswith(prefix)]
+    assert all(term in dictionary for term in terms[::7])
+    for word in ["abca", "あいa", "cccc", "b"]:
+        expected = {term: _levenshtein(word, term) for term in terms if _levenshtein(word, term) <= 2}
+        assert dict(dictionary.fuzzy(word, 2)) == expected
+
+
+def test_suggest():
+    dictionary = TermDictionary.from_terms(["dummy", "dumb", "dump", "resource", "source"])
+    assert dictionary.suggest("dumy") == ["dumb", "dummy", "dump"]
+    assert dictionary.suggest("dumy", weight={"dummy": 2, "dumb": 1, "dump": 1}.get)[0] == "dummy"
+    assert dictionary.suggest("resuorce") == ["resource"]
+    assert dictionary.suggest("dummy") == []
@@ -0,0 +1,55 @@
+from sagasu.incremental import Changes
+from sagasu.model import Resource
+from sagasu.segments import Segments
+
+
+def test_changes(build_index):
+    previous = build_index([
+        Resource(uri="a", sentence="x y"),
+        Resource(uri="b", sentence="y z"),
+        Resource(uri="c", sentence="z w"),
+    ])
+    changes = Changes(previous)
+    changed = changes.changed([
+        Resource(uri="b", sentence="y z"),
+        Resource(uri="c", sentence="z q"),
+        Resource(uri="d", sentence="x"),
+    ])
+    assert [resource.uri for resource in changed] == ["c", "d"]
+
+    changes.remove_missing({"b", "c", "d"}, lambda uri: True)
+    indexed_resource = changes.kept().merge(build_index(changed))
+    assert [resource.uri for resource in indexed_resource.documents] == ["b", "c", "d"]
+    assert [resource.uri for resource in indexed_resource.search("z")] == ["b", "c"]
+    assert [resource.uri for resource in indexed_resource.search("x")] == ["d"]
+    assert indexed_resource.search("w") == []
+
+
+def test_changes_stream(build_index):
+    changes = Changes(build_index([Resource(uri="a", sentence="x"), Resource(uri="b", sentence="y")]))
+    crawled = (Resource(uri=uri, sentence=sentence) for uri, sentence in [("a", "x"), ("b", "z"), ("c", "w")])
+    changed = changes.stream(crawled)
+    assert next(changed).uri == "b"
+    assert changes.seen == {"a", "b"}
+    assert [resource.uri for resource in changed] == ["c"]
+    assert changes.stale == {1}
+
+
+def test_changes_of_stored_index(tmp_path, monkeypatch, build_index):
+    segments = Segments(str(tmp_path / "segments"))
+    segments.replace(build_index([Resource(uri=uri, sentence=uri) for uri in ["a", "b", "c"]]))
+    segments.commit(build_index([Resource(uri="b", sentence="y")]), segments.open().locations([1]))
+    index = segments.open()
+
+    def decode(doc_id):
+        raise AssertionError(f"document {doc_id} decoded")
+
+    # uris and hashes are stored, documents are decoded only to be copied
+    for segment in index.segments:
+        monkeypatch.setattr(segment, "document", decode)
+    changes = Changes(index)
+    assert sorted(changes.uris()) == ["a", "b", "c"]
+    crawled = [Resource(uri="a", sentence="a"), Resource(uri="b", sentence="z"), Resource(uri="d", sentence="d")]
+    assert [resource.uri for resource in changes.changed(crawled)] == ["b", "d"]
+    changes.remove(["c", "e"])
+    assert changes.stale == {1, 2}
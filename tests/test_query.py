@@ -0,0 +1,31 @@
+import random
+
+from sagasu.model import IndexedResource, Resource
+from sagasu.postings import gallop, intersect, union
+from sagasu.query import QueryEvaluator, parse
+
+
+def test_intersect_and_union():
+    random.seed(0)
+    lists = [sorted(random.sample(range(10000), size)) for size in (5000, 300, 20)]
+    assert list(intersect(lists)) == sorted(set(lists[0]) & set(lists[1]) & set(lists[2]))
+    assert list(union(lists)) == sorted(set(lists[0]) | set(lists[1]) | set(lists[2]))
+    assert list(intersect([])) == []
+    assert gallop([1, 3, 5, 7], 4) == 2
+    assert gallop([1, 3, 5, 7], 8) == 4
+
+
+def test_query():
+    indexed_resource = IndexedResource(indexed={})
+    sentences = ["a b c d e", "a b c x d e", "c d e", "x y"]
+    for n, sentence in enumerate(sentences):
+        tokens = sentence.split()
+        doc_id = indexed_resource.add(Resource(uri=str(n), sentence=sentence), len(tokens))
+        for size in (1, 2, 3):
+            indexed_resource.add_postings(doc_id, ["".join(tokens[i: i + size]) for i in range(len(tokens) - size + 1)])
+
+    evaluator = QueryEvaluator(indexed_resource, n=3)
+    assert list(evaluator(parse("a e", str.split))) == [0, 1]
+    assert list(evaluator(parse('"a b c d e"', str.split))) == [0]
+    assert list(evaluator(parse("a OR y", str.split))) == [0, 1, 3]
+    assert list(evaluator(parse("unknown", str.split))) == []
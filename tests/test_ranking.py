@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from sagasu.model import IndexedResource, Resource
+from sagasu.ranking import BM25
+from sagasu.storage import MappedIndex, write_index
+
+
+def test_bm25_top_k():
+    indexed_resource = IndexedResource(indexed={})
+    documents = [
+        ["料理", "を", "楽しむ"],
+        ["料理", "料理", "料理"],
+        ["毎日", "の", "散歩", "を", "楽しむ"],
+    ]
+    for n, tokens in enumerate(documents):
+        doc_id = indexed_resource.add(Resource(uri=str(n), sentence="".join(tokens)), len(tokens))
+        indexed_resource.add_postings(doc_id, tokens)
+
+    bm25 = BM25(indexed_resource)
+    assert [doc_id for doc_id, _ in bm25.top_k(["料理"])] == [1, 0]
+    assert [doc_id for doc_id, _ in bm25.top_k(["料理", "楽しむ"], k=1)] == [0]
+    assert bm25.top_k(["unknown"]) == []
+
+
+def _exhaustive(bm25, terms, candidates=None):
+    index = bm25.index
+    average_length = index.average_document_length()
+    scores = {}
+    for term in set(terms):
+        doc_ids = index.postings(term)
+        if not len(doc_ids):
+            continue
+        idf = bm25.idf(len(doc_ids))
+        for doc_id, tf in zip(doc_ids, index.term_frequencies(term)):
+            if candidates is None or doc_id in candidates:
+                score = bm25.score(idf, tf, index.document_length(doc_id), average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def test_pruned_top_k_matches_exhaustive(tmp_path):
+    rng = random.Random(0)
+    indexed_resource = IndexedResource(indexed={})
+    for n in range(2000):
+        # particles are in almost every document, nouns in few of them
+        tokens = [rng.choice("のはを。") for _ in range(rng.randint(1, 8))]
+        tokens += [f"noun{int(rng.paretovariate(1.0))}" for _ in range(rng.randint(0, 4))]
+        doc_id = indexed_resource.add(Resource(uri=str(n), sentence="".join(tokens)), len(tokens))
+        indexed_resource.add_postings(doc_id, tokens)
+    write_index(indexed_resource, path := str(tmp_path / "index.idx"))
+
+    for index in [indexed_resource, MappedIndex(path)]:
+        bm25 = BM25(index)
+        for terms in [["の", "noun3"], ["の", "は", "を", "。"], ["noun1", "noun7", "noun40", "の"], ["noun2"]]:
+            for k in [1, 10, 100]:
+                top = bm25.top_k(terms, k)
+                expected = _exhaustive(bm25, terms)[:k]
+                assert [doc_id for doc_id, _ in top] == [doc_id for doc_id, _ in expected]
+                assert [score for _, score in top] == pytest.approx([score for _, score in expected])
+        candidates = list(range(0, 2000, 3))
+        top = bm25.top_k(["の", "noun2"], 10, candidates=candidates)
+        expected = _exhaustive(bm25, ["の", "noun2"], set(candidates))[:10]
+        assert [doc_id for doc_id, _ in top] == [doc_id for doc_id, _ in expected]
@@ -0,0 +1,21 @@
+from sagasu.model import Resource
+from sagasu.registry import DocumentRegistry
+
+
+def test_registry_collapses_duplicates(build_index):
+    registry = DocumentRegistry()
+    crawled = [
+        Resource(uri="a", sentence="x y"),
+        Resource(uri="b", sentence="y z"),
+        Resource(uri="a", sentence="x y"),
+        Resource(uri="b", sentence="z w"),
+    ]
+    admitted = list(registry.admit(crawled))
+    assert [(r.uri, r.sentence) for r in admitted] == [("a", "x y"), ("b", "y z"), ("b", "z w")]
+    assert registry.duplicates == 1
+
+    # the older version of b is merged after the newer one, as a concurrent crawler may do
+    indexed_resource = registry.collapse(build_index([admitted[2], admitted[0], admitted[1]]))
+    assert [(r.uri, r.sentence) for r in indexed_resource.documents] == [("b", "z w"), ("a", "x y")]
+    assert indexed_resource.postings("y").tolist() == [1]
+    assert indexed_resource.postings("z").tolist() == [0]
@@ -0,0 +1,36 @@
+from sagasu.config import ConfigModel, SourceModel
+from sagasu.dictionary import TermDictionary
+from sagasu.engine import SearchEngine
+from sagasu.repl import TermCompleter, repl
+
+
+def test_term_completer():
+    terms = TermDictionary.from_terms(["料理", "料理人", "散歩", "料"])
+    completer = TermCompleter(lambda: terms)
+    assert completer.complete("料理") == ["料理", "料理人"]
+    assert [completer("料", state) for state in range(4)] == ["料", "料理", "料理人", None]
+    assert completer.complete("猫") == []
+
+
+def test_repl(capsys):
+    search_engine = SearchEngine(ConfigModel([SourceModel(source_type="dummy", target="dummy")]))
+    search_engine.indexing(dump=False)
+    lines = iter(["dummy", "", "resource", ":grep ummy", ":regex (", "dumy", ":quit", "never read"])
+    repl(search_engine, read=lambda prompt: next(lines))
+
+    out = capsys.readouterr().out
+    assert "2 results, showing 2" in out
+    assert "1 results, showing 1" in out
+    assert out.count("2 results, showing 2") == 2
+    assert "invalid pattern" in out
+    assert "dumy: did you mean dummy?" in out
+
+
+def test_repl_builds_terms_on_completion():
+    search_engine = SearchEngine(ConfigModel([SourceModel(source_type="dummy", target="dummy")]))
+    search_engine.indexing(dump=False)
+    repl(search_engine, read=lambda prompt: ":quit")
+    # starting the repl does not build the dictionary, the first completion does
+    assert search_engine._terms is None
+    assert TermCompleter(lambda: search_engine.terms).complete("dumm")[0] == "dummy"
+    assert search_engine._terms is not None
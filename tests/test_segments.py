@@ -0,0 +1,128 @@
+import random
+
+from sagasu.model import DummyResource
+from sagasu.ranking import BM25
+from sagasu.segments import Segments
+from sagasu.storage import TRIGRAM_SECTIONS, write_index
+from sagasu.trigram import TrigramSearcher
+
+
+def _documents(rng, start, count):
+    # "common" is in more documents than a block, so that long lists are gathered too
+    documents = []
+    for n in range(start, start + count):
+        tokens = ["common"] * rng.randint(1, 3) + [f"term{rng.randint(0, 20)}" for _ in range(rng.randint(0, 4))]
+        documents.append(DummyResource(uri=f"doc{n}", sentence=" ".join(tokens)))
+    return documents
+
+
+def _resources(*documents):
+    return [DummyResource(uri=uri, sentence=sentence) for uri, sentence in documents]
+
+
+def _assert_same(index, expected):
+    assert len(index) == len(expected)
+    assert [document.uri for document in index.documents] == [document.uri for document in expected.documents]
+    assert list(index.document_lengths()) == list(expected.lengths)
+    assert index.average_document_length() == expected.average_document_length()
+    assert len(index.indexed) == len(expected.indexed)
+    assert {term: (list(doc_ids), list(tfs)) for term, doc_ids, tfs in index.iter_postings()} == {
+        term: (list(doc_ids), list(expected.frequencies[term])) for term, doc_ids in expected.indexed.items()
+    }
+    for term in ["common", "term3", "unknown"]:
+        assert list(index.postings(term)) == list(expected.postings(term))
+        assert BM25(index).top_k([term, "term5"], 10) == BM25(expected).top_k([term, "term5"], 10)
+
+
+def test_commit_and_merge(tmp_path, build_index):
+    rng = random.Random(0)
+    segments = Segments(str(tmp_path / "segments"))
+    live = _documents(rng, 0, 300)
+    segments.replace(build_index(live))
+    for start in range(300, 700, 100):
+        index = segments.open()
+        # delete a few documents, and modify a few others
+        stale = sorted(rng.sample(range(len(index)), 30))
+        modified = [DummyResource(uri=live[doc_id].uri, sentence="modified common") for doc_id in stale[:10]]
+        added = _documents(rng, start, 100) + modified
+        segments.commit(build_index(added), index.locations(stale))
+        live = [document for doc_id, document in enumerate(live) if doc_id not in set(stale)] + added
+
+        index = segments.open()
+        assert len(index.segments) > 1
+        _assert_same(index, build_index(live))
+        assert TrigramSearcher.open(index).trigram_index is not index
+        assert TrigramSearcher.open(index).substring("modified comm") == list(index.postings("modified"))
+
+    segments.compact()
+    index = segments.open()
+    assert len(index.segments) < 5
+    assert not any(entry.deleted for entry in index.entries)
+    _assert_same(index, build_index(live))
+    assert sorted(path.name for path in (tmp_path / "segments").glob("*.idx")) == sorted(
+        entry.name for entry in index.entries
+    )
+
+
+def test_deletions_follow_merged_segments(tmp_path, build_index):
+    segments = Segments(str(tmp_path / "segments"), merge_factor=2)
+    segments.replace(build_index(_resources(("a", "x"), ("b", "y"))))
+    segments.commit(build_index(_resources(("c", "x"), ("d", "y"))), {})
+    # an update computed against the index opened before the merge
+    before = segments.open()
+    assert segments.merge([entry.name for entry in before.entries])
+    segments.commit(build_index([]), before.locations([1, 2]))
+
+    index = segments.open()
+    assert len(index.segments) == 1
+    assert [document.uri for document in index.documents] == ["a", "d"]
+    assert list(index.postings("x")) == [0]
+    assert list(index.postings("y")) == [1]
+    assert "x" in index.indexed and "z" not in index.indexed
+    assert before.document(2).uri == "c"
+
+
+def test_merge_of_documents_deleted_meanwhile(tmp_path, build_index):
+    segments = Segments(str(tmp_path / "segments"), merge_factor=2)
+    segments.replace(build_index(_resources(("a", "x"))))
+    segments.commit(build_index(_resources(("b", "y"))), {})
+    before = segments.open()
+    write = segments._write
+
+    def write_and_delete(indexed_resource, name):
+        write(indexed_resource, name)
+        # an update deletes every document while the merged segment is written
+        segments.commit(build_index([]), before.locations([0, 1]))
+
+    segments._write = write_and_delete
+    segments.merge([entry.name for entry in before.entries])
+    assert segments.open() is None
+    assert list((tmp_path / "segments").glob("*.idx")) == []
+    assert not segments._writing and not segments._merged
+
+
+def test_adopt_legacy_index(tmp_path, build_index):
+    write_index(build_index(_resources(("a", "x"), ("b", "x y"))), str(tmp_path / "2020-01-01-00.idx"))
+    segments = Segments(str(tmp_path / "segments"))
+    index = segments.open()
+    assert [document.uri for document in index.documents] == ["a", "b"]
+    assert not index.has_terms(TRIGRAM_SECTIONS)
+    # opening writes nothing, the first update adopts the legacy index
+    assert segments.version() is None and not (tmp_path / "segments").exists()
+    segments.commit(build_index(_resources(("c", "z"))), index.locations([0]))
+    index = segments.open()
+    assert [document.uri for document in index.documents] == ["b", "c"]
+    assert segments.version() is not None
+
+    assert Segments(str(tmp_path / "empty" / "segments")).open() is None
+
+
+def test_outdated_pickled_index(tmp_path, build_index):
+    segments = Segments(str(tmp_path / "segments"))
+    assert segments.outdated() is None
+    (tmp_path / "2020-01-01-00.pkl").write_bytes(b"")
+    assert segments.open() is None
+    assert segments.outdated() == tmp_path / "2020-01-01-00.pkl"
+    # an index built since is searched, the pickle is left behind
+    segments.replace(build_index(_resources(("a", "x"))))
+    assert segments.outdated() is None
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from sagasu.model import ScrapboxResource
+from sagasu.snapshot import Snapshot
+
+
+def _resource(uri, sentence, images=()):
+    return ScrapboxResource(uri=uri, sentence=sentence, image_urls=list(images), image_captions=["猫" for _ in images])
+
+
+def test_snapshot_keeps_latest_version(tmp_path):
+    snapshot = Snapshot(str(tmp_path / "resources.snapshot"), ScrapboxResource, max_batches=2)
+    snapshot.append([_resource("a", "晴れ"), _resource("b", "雨", ["https://gyazo.com/1", "https://gyazo.com/2"])])
+    snapshot.append([_resource("a", "曇り", ["https://gyazo.com/3"]), _resource("c", "")])
+
+    resources = snapshot.load()
+    assert [(r.uri, r.sentence) for r in resources] == [("b", "雨"), ("a", "曇り"), ("c", "")]
+    assert resources[0].image_captions == ["猫", "猫"]
+    assert resources[1].image_urls == ["https://gyazo.com/3"]
+
+    # an interrupted append leaves a partial batch, which the next append replaces
+    with open(snapshot.path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00\x00\x00\x00\x00partial")
+    snapshot.append([_resource("b", "雪")])
+    assert [r.sentence for r in snapshot.load()] == ["曇り", "", "雪"]
+
+
+def test_snapshot_reads_legacy_tsv(tmp_path):
+    for kind, rows, columns in [
+        ("uri-sentence", [["a", "晴れ"], ["b", "雨"]], ["uri", "sentence"]),
+        ("uri-media", [["a"] + ["empty"] * 8, ["b", "https://gyazo.com/1"] + ["empty"] * 7],
+         ["uri"] + [f"media_url{n}" for n in range(1, 5)] + [f"media_caption{n}" for n in range(1, 5)]),
+    ]:
+        (tmp_path / kind).mkdir()
+        pd.DataFrame(rows, columns=columns).to_csv(tmp_path / kind / "2021-01-01-00.tsv", sep="\t")
+
+    snapshot = Snapshot(str(tmp_path / "resources.snapshot"), ScrapboxResource, str(tmp_path))
+    assert [r.sentence for r in snapshot.load()] == ["晴れ", "雨"]
+
+    snapshot.append([_resource("b", "雪")])
+    resources = snapshot.load()
+    assert [r.sentence for r in resources] == ["晴れ", "雪"]
+    assert resources[0].image_urls[0] == "empty"
@@ -0,0 +1,14 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ["spacy", "pandas", "tweepy", "numpy", "requests", "tensorflow"]
+
+
+def test_search_path_imports_no_heavy_module():
+    # a fresh interpreter, modules imported by other tests do not count
+    code = (
+        "import sys, sagasu.app, sagasu.engine, sagasu.repl; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    imported = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert imported.strip() == ""
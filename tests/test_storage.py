@@ -0,0 +1,84 @@
+import struct
+
+from sagasu.model import IndexedResource, DummyResource, ScrapboxResource, SpooledDocuments, encode_resource
+from sagasu.storage import MappedIndex, write_index
+
+
+def test_write_and_map_index(tmp_path):
+    indexed_resource = IndexedResource(indexed={})
+    doc_id = indexed_resource.add(DummyResource(uri="dummy", sentence="ある晴れた日のこと。"), 2)
+    indexed_resource.add_postings(doc_id, ["晴れ", "こと"])
+    doc_id = indexed_resource.add(
+        ScrapboxResource(uri="https://scrapbox.io/p/a", sentence="晴れ dummy", image_urls=[], image_captions=[]), 3
+    )
+    indexed_resource.add_postings(doc_id, ["晴れ", "晴れ", "dummy"])
+    write_index(indexed_resource, path := str(tmp_path / "index.idx"))
+
+    index = MappedIndex(path)
+    assert len(index) == 2
+    assert list(index.postings("晴れ")) == [0, 1]
+    assert list(index.term_frequencies("晴れ")) == [1, 2]
+    assert list(index.postings("unknown")) == []
+    assert "dummy" in index.indexed
+    assert sorted(index.terms()) == sorted(indexed_resource.indexed)
+    assert [resource.uri for resource in index.search("dummy")] == ["https://scrapbox.io/p/a"]
+    assert type(index.document(1)) is ScrapboxResource
+    assert index.document_length(1) == 3
+    assert index.average_document_length() == 2.5
+
+
+def test_write_spooled_documents(tmp_path):
+    documents = [DummyResource(uri=str(n), sentence=f"晴れ {n}") for n in range(10)]
+    for n, spooled in enumerate([documents, SpooledDocuments(documents)]):
+        indexed_resource = IndexedResource(indexed={}, documents=spooled)
+        indexed_resource.lengths.extend([2] * len(documents))
+        write_index(indexed_resource, str(tmp_path / f"{n}.idx"))
+    assert [document.uri for document in SpooledDocuments(documents)[-2:]] == ["8", "9"]
+    assert (tmp_path / "0.idx").read_bytes() == (tmp_path / "1.idx").read_bytes()
+
+
+def test_long_posting_lists(tmp_path):
+    indexed_resource = IndexedResource(indexed={})
+    for n in range(1000):
+        doc_id = indexed_resource.add(DummyResource(uri=str(n), sentence=str(n)), 1)
+        indexed_resource.add_postings(doc_id, ["every"] * (n % 3 + 1) + (["third"] if n % 3 == 0 else []))
+    write_index(indexed_resource, path := str(tmp_path / "index.idx"))
+
+    index = MappedIndex(path)
+    assert list(index.postings("every")) == list(range(1000))
+    assert list(index.term_frequencies("every")) == [n % 3 + 1 for n in range(1000)]
+    assert list(index.postings("third")) == list(range(0, 1000, 3))
+    assert {term: list(postings) for term, postings, _ in index.iter_postings()} == {
+        term: list(postings) for term, postings in indexed_resource.indexed.items()
+    }
+
+
+def test_map_version_1_index(tmp_path):
+    # postings and frequencies as uint32, at the same offsets in their sections
+    terms = [(b"dummy", [1], [1]), (b"hare", [0, 1], [1, 2])]
+    term_table = b"".join(
+        struct.pack("<QIQI", sum(len(t) for t, _, _ in terms[:i]), len(term), 8 * i, len(doc_ids))
+        for i, (term, doc_ids, _) in enumerate(terms)
+    )
+    documents = [encode_resource(DummyResource(uri=uri, sentence=uri)) for uri in ["a", "b"]]
+    sections = [
+        (b"TERMS", term_table),
+        (b"TERMBLOB", b"".join(term for term, _, _ in terms)),
+        (b"POSTINGS", struct.pack("<4I", 1, 0, 0, 1)),
+        (b"FREQS", struct.pack("<4I", 1, 0, 1, 2)),
+        (b"DOCS", struct.pack("<3Q", 0, len(documents[0]), len(documents[0]) + len(documents[1]))),
+        (b"DOCBLOB", b"".join(documents)),
+    ]
+    header = struct.pack("<8sII", b"SAGASUIX", 1, len(sections))
+    offset = len(header) + 24 * len(sections)
+    table = b""
+    for name, body in sections:
+        table += struct.pack("<8sQQ", name, offset, len(body))
+        offset += len(body)
+    (path := tmp_path / "old.idx").write_bytes(header + table + b"".join(body for _, body in sections))
+
+    index = MappedIndex(str(path))
+    assert list(index.postings("hare")) == [0, 1]
+    assert list(index.term_frequencies("hare")) == [1, 2]
+    assert list(index.postings("dummy")) == [1]
+    assert index.document(1).uri == "b"
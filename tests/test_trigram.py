@@ -0,0 +1,66 @@
+from sagasu.config import ConfigModel, SourceModel
+from sagasu.engine import SearchEngine
+from sagasu.model import DummyResource
+from sagasu.storage import TRIGRAM_SECTIONS, MappedIndex, write_index
+from sagasu.trigram import TrigramSearcher, build, required_trigrams
+
+
+def _index(build_index):
+    return build_index(
+        DummyResource(uri=sentence, sentence=sentence)
+        for sentence in ["ある晴れた日のこと。", "晴れのち雨", "sagasu is a search engine"]
+    )
+
+
+def test_required_trigrams():
+    assert required_trigrams("search") == {"sea", "ear", "arc", "rch"}
+    assert required_trigrams("^sa(gas)+u") == {"gas"}
+    assert required_trigrams("engine|search") is None
+    assert required_trigrams("(?i)search") is None
+    assert required_trigrams("(?i:search)") is None
+    assert required_trigrams("(?:x(?i:search))+") is None
+    assert required_trigrams("ab?c") is None
+
+
+def test_substring_and_regex(build_index):
+    indexed_resource = _index(build_index)
+    searcher = TrigramSearcher(indexed_resource, build(indexed_resource.documents))
+    assert searcher.substring("晴れ") == [0, 1]
+    assert searcher.substring("れた日") == [0]
+    assert searcher.substring("s a s") == [2]
+    assert searcher.substring("雨天") == []
+    assert searcher.regex("晴れ.日") == [0]
+    assert searcher.regex("^sa.+engine$") == [2]
+    assert searcher.regex("雨|engine") == [1, 2]
+
+    indexed_resource = build_index(
+        DummyResource(uri=sentence, sentence=sentence) for sentence in ["SEARCH engine", "search"]
+    )
+    searcher = TrigramSearcher(indexed_resource, build(indexed_resource.documents))
+    assert searcher.regex("(?i:search)") == [0, 1]
+
+
+def test_trigrams_stored_with_index(tmp_path, build_index):
+    indexed_resource = _index(build_index)
+    write_index(indexed_resource, path := str(tmp_path / "index.idx"), trigrams=build(indexed_resource.documents))
+    index = MappedIndex(path)
+    assert index.has_terms(TRIGRAM_SECTIONS)
+    searcher = TrigramSearcher.open(index)
+    assert searcher.trigram_index is not index
+    assert list(searcher.trigram_index.postings("晴れの")) == [1]
+    assert searcher.substring("search eng") == [2]
+    # the term dictionary of the index is left as it was
+    assert list(index.postings("晴れのち雨")) == [1]
+
+    write_index(indexed_resource, path := str(tmp_path / "old.idx"))
+    assert TrigramSearcher.open(MappedIndex(path)).substring("晴れ") == [0, 1]
+
+
+def test_grep():
+    search_engine = SearchEngine(ConfigModel([SourceModel(source_type="dummy", target="dummy")]))
+    search_engine.indexing(dump=False)
+    total, resources = search_engine.grep("ummy")
+    assert total == 2
+    assert [resource.uri for resource in resources] == ["dummy", "dummy2"]
+    total, resources = search_engine.grep(r"is\s+a", regex=True)
+    assert total == 1 and resources[0].uri == "dummy2"